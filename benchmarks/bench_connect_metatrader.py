@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Measures throughput and tail latency of ConnectMetaTrader against the offline MetaApi stand-in.
+
+Usage:
+    python benchmarks/bench_connect_metatrader.py [--signals 200] [--concurrency 10] [--accounts 1]
+                                                  [--calculate] [--time-scale 1] [--order-errors 0.0]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import harness
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--signals', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--calculate', action='store_true', help='only calculate the trades instead of entering them')
+    parser.add_argument('--time-scale', type=float, default=1, help='factor applied to every fake MetaApi delay')
+    parser.add_argument('--order-errors', type=float, default=0.0, help='probability that an order is rejected')
+    return parser.parse_args()
+
+arguments = ParseArguments()
+
+# the accounts are read when run is imported
+harness.UseFakeAccounts(arguments.accounts)
+
+import fake_metaapi
+import run
+
+SIGNAL = "BUY EURUSD\nEntry NOW\nSL 1.08500\nTP 1.09500\nTP 1.10000\n\nSELL LIMIT GBPJPY\nEntry 184.000\nSL 185.000\nTP 182.000"
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = 0
+        self.date = None
+        self.chat_id = 1
+        self.bot = None
+
+    def reply_text(self, text: str, **kwargs) -> None:
+        self.replies += 1
+
+class FakeUpdate:
+    def __init__(self):
+        self.effective_message = FakeMessage()
+
+async def Benchmark() -> None:
+    errors = {method: arguments.order_errors for method in fake_metaapi.ORDER_METHODS}
+    fake = fake_metaapi.Install(run, fake_metaapi.Profile(timeScale=arguments.time_scale, errors=errors))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[manager.GetConnection() for manager in run.connectionManagers])
+    print(f'connected {len(run.connectionManagers)} account(s) in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    trades = run.ParseSignals(SIGNAL)
+    semaphore = asyncio.Semaphore(arguments.concurrency)
+    durations = []
+
+    async def Send():
+        async with semaphore:
+            begin = time.perf_counter()
+            await run.ConnectMetaTrader(FakeUpdate(), trades, not arguments.calculate)
+            durations.append(time.perf_counter() - begin)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[Send() for _ in range(arguments.signals)])
+    elapsed = time.perf_counter() - start
+
+    print(f'{arguments.signals} messages in {elapsed:.2f} s: {arguments.signals / elapsed:,.1f} messages/s')
+    print(harness.FormatPercentiles(durations))
+    print(f'\nLatency (ms)\n\n{run.latency.Summary()}')
+    print(f'\nMetaApi calls: {json.dumps(fake.Calls(), sort_keys=True)}')
+
+    for manager in run.connectionManagers:
+        await manager.Reset()
+
+if __name__ == '__main__':
+    asyncio.run(Benchmark())
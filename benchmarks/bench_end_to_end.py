@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Drives the real handler stack of run.py with synthetic Telegram updates against the offline MetaApi stand-in.
+
+Every simulated user runs /trade (or /calculate and /yes) conversations one after another, so the number of
+users is the number of concurrent conversations. Reports signal-to-order latency, that is the time from the
+signal (or /yes) reaching the dispatcher to the bot reporting the orders, messages per second and the memory
+high-water mark.
+
+Usage:
+    python benchmarks/bench_end_to_end.py [--users 10] [--signals 20] [--rate 0] [--mode trade]
+                                          [--accounts 1] [--time-scale 1] [--telegram-latency 0]
+                                          [--order-errors 0] [--async-dispatcher]
+"""
+import argparse
+import json
+import os
+import queue
+import resource
+import threading
+import time
+
+import harness
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help='number of concurrent conversations')
+    parser.add_argument('--signals', type=int, default=20, help='signals sent by every user')
+    parser.add_argument('--rate', type=float, default=0, help='maximum signals per second over all users, 0 for no limit')
+    parser.add_argument('--mode', choices=['trade', 'calculate'], default='trade', help='enter signals with /trade, or /calculate and /yes')
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--time-scale', type=float, default=1, help='factor applied to every fake MetaApi delay')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='seconds every reply blocks for')
+    parser.add_argument('--order-errors', type=float, default=0.0, help='probability that an order is rejected')
+    parser.add_argument('--async-dispatcher', action='store_true', help='handle updates and replies on the event loop like ASYNC_DISPATCHER')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for a reply')
+    return parser.parse_args()
+
+arguments = ParseArguments()
+
+# the accounts and the authorized user are read when run is imported
+harness.UseFakeAccounts(arguments.accounts)
+os.environ['TELEGRAM_USER'] = 'benchmark'
+
+import fake_metaapi
+import fake_telegram
+import run
+from telegram import Update
+
+SIGNAL = "BUY EURUSD\nEntry NOW\nSL 1.08500\nTP 1.09500\nTP 1.10000"
+
+# replies that end a conversation with a single account, several accounts end it with the accounts table
+FINAL_REPLIES = ('Trade entered successfully', 'There was an issue', 'There was an error parsing')
+
+class Driver:
+    """Sends updates for the simulated users and hands every reply to the user it was sent to."""
+
+    def __init__(self, dispatcher, bot, submit):
+        self.dispatcher = dispatcher
+        self.submit = submit
+        self.bot = bot
+        self.lock = threading.Lock()
+        self.updateId = 0
+        self.updates = 0
+        self.inboxes = {}
+        self.nextSignal = time.perf_counter()
+        bot.listeners.append(lambda chatId, text: self.inboxes[chatId].put(text))
+
+    def Send(self, chatId: int, text: str) -> None:
+        with self.lock:
+            self.updateId += 1
+            self.updates += 1
+            updateId = self.updateId
+
+        update = Update.de_json(fake_telegram.CreateUpdate(updateId, chatId, text, run.TELEGRAM_USER), self.bot)
+        self.submit(update)
+
+    def Expect(self, chatId: int, prefixes: tuple) -> str:
+        """Waits for the next reply to a user that starts with one of the prefixes."""
+
+        deadline = time.perf_counter() + arguments.timeout
+
+        while True:
+            text = self.inboxes[chatId].get(timeout=max(0.001, deadline - time.perf_counter()))
+            if text.startswith(prefixes) and (not text.startswith('<pre>') or '| Account ' in text):
+                return text
+
+    def Throttle(self) -> None:
+        if not arguments.rate:
+            return
+
+        with self.lock:
+            start = max(time.perf_counter(), self.nextSignal)
+            self.nextSignal = start + 1 / arguments.rate
+
+        time.sleep(max(0.0, start - time.perf_counter()))
+
+def Converse(driver: Driver, chatId: int, latencies: list, failures: list) -> None:
+    driver.inboxes[chatId] = queue.Queue()
+
+    for _ in range(arguments.signals):
+        driver.Throttle()
+
+        try:
+            if arguments.mode == 'trade':
+                driver.Send(chatId, '/trade')
+                driver.Expect(chatId, ('Please enter the trade',))
+                start = time.perf_counter()
+                driver.Send(chatId, SIGNAL)
+            else:
+                driver.Send(chatId, '/calculate')
+                driver.Expect(chatId, ('Please enter the trade',))
+                driver.Send(chatId, SIGNAL)
+                driver.Expect(chatId, ('Would you like to enter this trade?',))
+                start = time.perf_counter()
+                driver.Send(chatId, '/yes')
+
+            reply = driver.Expect(chatId, FINAL_REPLIES if arguments.accounts == 1 else ('<pre>+',))
+            latencies.append(time.perf_counter() - start)
+
+            if not reply.startswith(('Trade entered successfully', '<pre>+')):
+                failures.append(reply)
+
+        except queue.Empty:
+            failures.append('timeout')
+
+def main() -> None:
+    errors = {method: arguments.order_errors for method in fake_metaapi.ORDER_METHODS}
+    fake = fake_metaapi.Install(run, fake_metaapi.Profile(timeScale=arguments.time_scale, errors=errors))
+
+    start = time.perf_counter()
+    for manager in run.connectionManagers:
+        run.SubmitCoroutine(manager.GetConnection()).result()
+    print(f'connected {len(run.connectionManagers)} account(s) in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    if arguments.async_dispatcher:
+        bot = fake_telegram.CreateAsyncBot(run, latency=arguments.telegram_latency)
+        dispatcher = run.CreateAsyncDispatcher(bot)
+        driver = Driver(dispatcher, bot, lambda update: fake_telegram.SubmitAsync(run, dispatcher, update))
+    else:
+        bot = fake_telegram.FakeBot(latency=arguments.telegram_latency)
+        dispatcher = fake_telegram.CreateDispatcher(run, bot)
+        driver = Driver(dispatcher, bot, dispatcher.update_queue.put)
+
+    latencies = []
+    failures = []
+    users = [threading.Thread(target=Converse, args=(driver, 1000 + user, latencies, failures)) for user in range(arguments.users)]
+
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - start
+
+    print(f'{len(latencies)} signals and {driver.updates} updates in {elapsed:.2f} s: {len(latencies) / elapsed:,.1f} signals/s, {driver.updates / elapsed:,.1f} messages/s')
+    if latencies:
+        print(f'signal to order {harness.FormatPercentiles(latencies)}')
+    print(f'failures: {len(failures)}')
+    print(f'memory high-water mark: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.1f} MiB')
+    print(f'\nLatency (ms)\n\n{run.latency.Summary()}')
+    print(f'\nMetaApi calls: {json.dumps(fake.Calls(), sort_keys=True)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Measures ParseSignal throughput on a corpus of realistic signals.
+
+Compares the compiled parser in run.py with the original if/elif parser it replaced.
+
+Usage:
+    python benchmarks/bench_parse_signal.py [--signals 20000] [--repeat 5]
+"""
+import argparse
+import random
+import timeit
+
+import harness
+
+import run
+
+def LegacyParseSignal(signal: str) -> dict:
+    signal = signal.splitlines()
+    signal = [line.rstrip() for line in signal]
+
+    trade = {}
+
+    if 'Buy Limit'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Buy Limit'
+    elif 'Sell Limit'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Sell Limit'
+    elif 'Buy Stop'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Buy Stop'
+    elif 'Sell Stop'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Sell Stop'
+    elif 'Buy'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Buy'
+    elif 'Sell'.lower() in signal[0].lower():
+        trade['OrderType'] = 'Sell'
+    else:
+        return {}
+
+    trade['Symbol'] = (signal[0].split())[-1].upper()
+
+    if trade['Symbol'] not in run.SYMBOLS:
+        return {}
+
+    if trade['OrderType'] == 'Buy' or trade['OrderType'] == 'Sell':
+        trade['Entry'] = (signal[1].split())[-1]
+    else:
+        trade['Entry'] = float((signal[1].split())[-1])
+
+    trade['StopLoss'] = float((signal[2].split())[-1])
+    trade['TP'] = [float((signal[3].split())[-1])]
+
+    if len(signal) > 4:
+        trade['TP'].append(float(signal[4].split()[-1]))
+
+    trade['RiskFactor'] = run.RISK_FACTOR
+
+    return trade
+
+def CreateCorpus(count: int, seed: int = 7) -> list:
+    """Builds signals in the formats accepted by the bot, including rejected ones."""
+
+    generator = random.Random(seed)
+    symbols = [symbol for symbol in run.SYMBOLS if symbol != 'NOW']
+    orderTypes = ['BUY', 'SELL', 'Buy Limit', 'SELL LIMIT', 'buy stop', 'Sell Stop']
+    corpus = []
+
+    for _ in range(count):
+        symbol = generator.choice(symbols)
+        orderType = generator.choice(orderTypes)
+        price = 150.0 if symbol.endswith('JPY') else 1.2
+        entry = 'NOW' if orderType.lower() in ('buy', 'sell') else f'{price:.5f}'
+        lines = [f'{orderType} {symbol}', f'Entry {entry}', f'SL {price * 0.99:.5f}', f'TP {price * 1.01:.5f}']
+
+        if generator.random() < 0.5:
+            lines.append(f'TP {price * 1.02:.5f}')
+
+        if generator.random() < 0.05:
+            lines[0] = f'{orderType} BTCUSD'
+
+        corpus.append('\n'.join(lines))
+
+    return corpus
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--signals', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+
+    corpus = CreateCorpus(arguments.signals)
+
+    for signal in corpus:
+        assert run.ParseSignal(signal) == LegacyParseSignal(signal), signal
+
+    for name, function in [('legacy', LegacyParseSignal), ('compiled', run.ParseSignal)]:
+        best = min(timeit.repeat(lambda: [function(signal) for signal in corpus], number=1, repeat=arguments.repeat))
+        print(f'{name:>8}: {len(corpus) / best:>12,.0f} signals/s  {best / len(corpus) * 1e6:.2f} us/signal')
+
+if __name__ == '__main__':
+    main()
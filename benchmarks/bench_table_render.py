@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Measures trade table rendering throughput and allocations.
+
+Compares the fixed-width renderer in run.py with the PrettyTable tables it replaced, for the trade
+summary and for the multi-account summary.
+
+Usage:
+    python benchmarks/bench_table_render.py [--tables 5000] [--repeat 5]
+"""
+import argparse
+import random
+import timeit
+import tracemalloc
+
+from prettytable import PrettyTable
+
+import harness
+
+import run
+
+def LegacyCreateTable(trade: dict, balance: float, sizing: dict) -> str:
+    table = PrettyTable()
+    table.title = "Trade Information"
+    table.field_names = ["Key", "Value"]
+    table.align["Key"] = "l"
+    table.align["Value"] = "l"
+
+    table.add_row([trade["OrderType"], trade["Symbol"]])
+    table.add_row(['Entry\n', trade['Entry']])
+    table.add_row(['Stop Loss', '{} pips'.format(sizing['StopLossPips'])])
+
+    for count, takeProfit in enumerate(sizing['TakeProfitPips']):
+        table.add_row([f'TP {count + 1}', f'{takeProfit} pips'])
+
+    table.add_row(['\nRisk Factor', '\n{:,.0f} %'.format(trade['RiskFactor'] * 100)])
+    table.add_row(['Position Size', trade['PositionSize']])
+    table.add_row(['\nCurrent Balance', '\n$ {:,.2f}'.format(balance)])
+    table.add_row(['Potential Loss', '$ {:,.2f}'.format(sizing['PotentialLoss'])])
+
+    for count, profit in enumerate(sizing['Profits']):
+        table.add_row([f'TP {count + 1} Profit', '$ {:,.2f}'.format(profit)])
+
+    table.add_row(['\nTotal Profit', '\n$ {:,.2f}'.format(sizing['TotalProfit'])])
+
+    return table.get_string()
+
+def LegacyRenderTable(title: str, fieldNames: list, rows: list) -> str:
+    table = PrettyTable()
+    table.title = title
+    table.field_names = fieldNames
+    table.align = "l"
+
+    for row in rows:
+        table.add_row(row)
+
+    return table.get_string()
+
+def CreateCorpus(count: int, seed: int = 7) -> list:
+    """Builds sized trades of random symbols, balances and take profit counts."""
+
+    generator = random.Random(seed)
+    symbols = [symbol for symbol in run.SYMBOLS if symbol != 'NOW']
+    rows = []
+
+    for _ in range(count):
+        symbol = generator.choice(symbols)
+        symbolInfo = run.DEFAULT_SYMBOL_INFO[symbol]
+        entry = round(generator.uniform(0.5, 200), 5)
+        pips = symbolInfo['PipSize'] * generator.randint(5, 200)
+        trade = {
+            'OrderType': generator.choice(['Buy', 'Sell Limit', 'Buy Stop']),
+            'Symbol': symbol,
+            'Entry': entry,
+            'StopLoss': entry - pips,
+            'TP': [entry + pips * (leg + 1) for leg in range(generator.choice([1, 2]))],
+            'RiskFactor': generator.choice([0.005, 0.01, 0.02]),
+        }
+        rows.append((trade, generator.uniform(25000, 10000000), symbolInfo))
+
+    sizings = run.SizeTrades(rows)
+    return [(trade, balance, sizing) for (trade, balance, _), sizing in zip(rows, sizings) if sizing['Error'] is None]
+
+def CreateSummary(corpus: list, accounts: int = 20) -> list:
+    """Builds the rows of a multi-account summary from the first trades of the corpus."""
+
+    return [
+        [f'Account {count}', '$ {:,.2f}'.format(balance), f'{trade["OrderType"]} {trade["Symbol"]}', trade['PositionSize'],
+         '\n'.join(f'TP {leg + 1}: TRADE_RETCODE_DONE' for leg in range(len(trade['TP'])))]
+        for count, (trade, balance, _) in enumerate(corpus[:accounts])
+    ]
+
+def Allocated(function) -> int:
+    """Returns the peak memory in bytes allocated while running the function once."""
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+
+    corpus = CreateCorpus(arguments.tables)
+    summary = CreateSummary(corpus)
+    fieldNames = ["Account", "Balance", "Trade", "Lots", "Result"]
+
+    for trade, balance, sizing in corpus:
+        assert run.CreateTable(trade, balance, sizing) == LegacyCreateTable(trade, balance, sizing), trade
+
+    assert run.RenderTable("Accounts", fieldNames, summary) == LegacyRenderTable("Accounts", fieldNames, summary)
+
+    cases = [
+        ('trade', 'prettytable', lambda row: LegacyCreateTable(*row), corpus),
+        ('trade', 'fixed-width', lambda row: run.CreateTable(*row), corpus),
+        ('summary', 'prettytable', lambda rows: LegacyRenderTable("Accounts", fieldNames, rows), [summary] * 100),
+        ('summary', 'fixed-width', lambda rows: run.RenderTable("Accounts", fieldNames, rows), [summary] * 100),
+    ]
+
+    for table, name, render, items in cases:
+        best = min(timeit.repeat(lambda: [render(item) for item in items], number=1, repeat=arguments.repeat))
+        peak = max(Allocated(lambda: render(item)) for item in items[:100])
+        print(f'{table:>8} {name:>12}: {len(items) / best:>10,.0f} tables/s  {best / len(items) * 1e6:>8.1f} us/table  {peak / 1024:>6.1f} KiB peak')
+
+if __name__ == '__main__':
+    main()
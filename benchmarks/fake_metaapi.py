@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""Offline stand-in for the part of the MetaApi SDK used by run.py.
+
+Every call sleeps for a delay drawn from a configurable latency distribution and can fail with a configurable
+probability, and quotes come from a synthetic random walk that is also streamed to synchronization listeners.
+This makes it possible to exercise ConnectMetaTrader, PlaceTrade and CalculateTrade without a MetaApi account.
+
+Usage:
+    import fake_metaapi
+    fake = fake_metaapi.Install(run, fake_metaapi.Profile(errors={'create_market_buy_order': 0.05}))
+"""
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from metaapi_cloud_sdk.clients.metaApi.notConnectedException import NotConnectedException
+from metaapi_cloud_sdk.clients.metaApi.tradeException import TradeException
+from metaapi_cloud_sdk.clients.timeoutException import TimeoutException
+
+# mid price every symbol starts its random walk from
+START_PRICES = {
+    'AUDCAD': 0.8950, 'AUDCHF': 0.6150, 'AUDJPY': 96.50, 'AUDNZD': 1.0850, 'AUDUSD': 0.6650, 'CADCHF': 0.6700,
+    'CADJPY': 107.80, 'CHFJPY': 160.20, 'EURAUD': 1.6350, 'EURCAD': 1.4650, 'EURCHF': 0.9750, 'EURGBP': 0.8600,
+    'EURJPY': 157.50, 'EURNZD': 1.7750, 'EURUSD': 1.0900, 'GBPAUD': 1.9000, 'GBPCAD': 1.7050, 'GBPCHF': 1.1350,
+    'GBPJPY': 183.20, 'GBPNZD': 2.0650, 'GBPUSD': 1.2700, 'NZDCAD': 0.8250, 'NZDCHF': 0.5650, 'NZDJPY': 88.90,
+    'NZDUSD': 0.6100, 'USDCAD': 1.3450, 'USDCHF': 0.8950, 'USDJPY': 144.50, 'XAGUSD': 23.50, 'XAUUSD': 1950.00,
+}
+
+# median and 99th percentile in seconds of every call, roughly what the MetaApi cloud answers with
+DEFAULT_LATENCIES = {
+    'get_account': (0.05, 0.2),
+    'deploy': (0.5, 2),
+    'wait_connected': (0.2, 1),
+    'undeploy': (0.2, 1),
+    'connect': (0.05, 0.2),
+    'wait_synchronized': (0.3, 1.5),
+    'subscribe_to_market_data': (0.02, 0.1),
+    'get_account_information': (0.04, 0.25),
+    'get_symbol_price': (0.04, 0.25),
+    'get_symbol_specification': (0.04, 0.25),
+    'get_positions': (0.04, 0.25),
+    'get_server_time': (0.03, 0.15),
+    'order': (0.08, 0.5),
+}
+
+ORDER_METHODS = ('create_market_buy_order', 'create_market_sell_order', 'create_limit_buy_order', 'create_limit_sell_order', 'create_stop_buy_order', 'create_stop_sell_order')
+
+class Profile:
+    """Configuration of the fake account, its latencies, injected errors and price feed.
+
+    Arguments:
+        latencies: (median, p99) in seconds per call name, overriding DEFAULT_LATENCIES; orders use 'order'
+            unless their method is listed
+        errors: probability per call name that the call fails
+        timeScale: factor applied to every delay, 0 answers immediately
+        login: MT4 login reported by the account information
+        balance: starting balance of the account
+        currency: account currency
+        tickInterval: seconds between two streamed quotes of a symbol
+        volatility: standard deviation of a price step relative to the price
+        spread: spread in pips
+        seed: seed of the latency, error and price generators
+    """
+
+    def __init__(self, latencies: dict = None, errors: dict = None, timeScale: float = 1, login: int = 1, balance: float = 10000,
+                 currency: str = 'USD', tickInterval: float = 0.25, volatility: float = 0.0002, spread: float = 1, seed: int = 7):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.errors = dict(errors or {})
+        self.timeScale = timeScale
+        self.login = login
+        self.balance = balance
+        self.currency = currency
+        self.tickInterval = tickInterval
+        self.volatility = volatility
+        self.spread = spread
+        self.seed = seed
+
+def Digits(symbol: str) -> int:
+    if symbol == 'XAUUSD':
+        return 2
+    if symbol == 'XAGUSD' or symbol.endswith('JPY'):
+        return 3
+    return 5
+
+def PipSize(symbol: str) -> float:
+    if symbol == 'XAUUSD':
+        return 0.1
+    if symbol == 'XAGUSD':
+        return 0.001
+    if symbol.endswith('JPY'):
+        return 0.01
+    return 0.0001
+
+class PriceFeed:
+    """Random walk of the mid price of every symbol, with a fixed spread in pips."""
+
+    def __init__(self, profile: Profile, generator: random.Random):
+        self.profile = profile
+        self.generator = generator
+        self.mids = dict(START_PRICES)
+
+    def Step(self, symbol: str) -> dict:
+        self.mids[symbol] *= math.exp(self.generator.gauss(0, self.profile.volatility))
+        return self.Price(symbol)
+
+    def Price(self, symbol: str) -> dict:
+        if symbol not in self.mids:
+            raise ValueError(f'Unknown symbol {symbol}')
+
+        mid = self.mids[symbol]
+        halfSpread = PipSize(symbol) * self.profile.spread / 2
+        return {'symbol': symbol, 'bid': round(mid - halfSpread, Digits(symbol)), 'ask': round(mid + halfSpread, Digits(symbol)), 'time': time.time()}
+
+class Broker:
+    """Account state shared by the connections of one fake account, and the source of latency and errors."""
+
+    def __init__(self, accountId: str, profile: Profile):
+        self.accountId = accountId
+        self.profile = profile
+        self.generator = random.Random(f'{profile.seed}:{accountId}')
+        self.prices = PriceFeed(profile, self.generator)
+        self.positions = []
+        self.calls = {}
+
+    async def Call(self, name: str, latency: str = None) -> None:
+        """Waits for the latency of a call and raises its injected error, if it fails this time."""
+
+        self.calls[name] = self.calls.get(name, 0) + 1
+        median, p99 = self.profile.latencies.get(name) or self.profile.latencies[latency or name]
+
+        if median > 0 and self.profile.timeScale > 0:
+            # lognormal delay with the configured median and 99th percentile
+            sigma = math.log(max(p99, median) / median) / 2.326
+            await asyncio.sleep(median * math.exp(self.generator.gauss(0, sigma)) * self.profile.timeScale)
+        else:
+            await asyncio.sleep(0)
+
+        if self.generator.random() < self.profile.errors.get(name, 0):
+            if name in ORDER_METHODS:
+                raise TradeException('Market is closed', 10018, 'TRADE_RETCODE_MARKET_CLOSED')
+            if name in ('connect', 'wait_connected', 'get_server_time'):
+                raise NotConnectedException(f'Injected {name} failure')
+            raise TimeoutException(f'Injected {name} timeout')
+
+    def AccountInformation(self) -> dict:
+        return {'login': self.profile.login, 'balance': self.profile.balance, 'equity': self.profile.balance, 'currency': self.profile.currency,
+                'leverage': 100, 'platform': 'mt4', 'broker': 'Fake Broker', 'server': 'Fake-Demo'}
+
+    def Specification(self, symbol: str) -> dict:
+        if symbol not in START_PRICES:
+            raise ValueError(f'Unknown symbol {symbol}')
+
+        contractSize = 100 if symbol == 'XAUUSD' else 5000 if symbol == 'XAGUSD' else 100000
+        return {'symbol': symbol, 'digits': Digits(symbol), 'point': 10 ** -Digits(symbol), 'pipSize': PipSize(symbol), 'contractSize': contractSize,
+                'profitCurrency': symbol[3:], 'volumeStep': 0.01, 'minVolume': 0.01, 'maxVolume': 100}
+
+    def Order(self, method: str, symbol: str, volume: float, openPrice: float = None) -> dict:
+        price = self.prices.Price(symbol)
+        orderId = uuid.uuid4().hex[:8]
+
+        if method.startswith('create_market'):
+            buy = method == 'create_market_buy_order'
+            self.positions.append({'id': orderId, 'symbol': symbol, 'type': 'POSITION_TYPE_BUY' if buy else 'POSITION_TYPE_SELL',
+                                   'volume': volume, 'openPrice': price['ask'] if buy else price['bid']})
+            return {'numericCode': 10009, 'stringCode': 'TRADE_RETCODE_DONE', 'message': 'Request completed', 'orderId': orderId, 'positionId': orderId}
+
+        return {'numericCode': 10009, 'stringCode': 'TRADE_RETCODE_DONE', 'message': 'Request completed', 'orderId': orderId}
+
+class FakeRpcConnection:
+    def __init__(self, broker: Broker):
+        self.broker = broker
+
+    async def connect(self):
+        await self.broker.Call('connect')
+
+    async def wait_synchronized(self, timeout_in_seconds: float = 300):
+        await self.broker.Call('wait_synchronized')
+
+    async def close(self):
+        return
+
+    async def get_account_information(self) -> dict:
+        await self.broker.Call('get_account_information')
+        return self.broker.AccountInformation()
+
+    async def get_positions(self) -> list:
+        await self.broker.Call('get_positions')
+        return list(self.broker.positions)
+
+    async def get_symbol_specification(self, symbol: str) -> dict:
+        await self.broker.Call('get_symbol_specification')
+        return self.broker.Specification(symbol)
+
+    async def get_symbol_price(self, symbol: str, keep_subscription: bool = False) -> dict:
+        await self.broker.Call('get_symbol_price')
+        return self.broker.prices.Price(symbol)
+
+    async def get_server_time(self) -> dict:
+        await self.broker.Call('get_server_time')
+        return {'time': time.time(), 'brokerTime': time.strftime('%Y-%m-%d %H:%M:%S.000')}
+
+    async def create_market_buy_order(self, symbol: str, volume: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_market_buy_order', 'order')
+        return self.broker.Order('create_market_buy_order', symbol, volume)
+
+    async def create_market_sell_order(self, symbol: str, volume: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_market_sell_order', 'order')
+        return self.broker.Order('create_market_sell_order', symbol, volume)
+
+    async def create_limit_buy_order(self, symbol: str, volume: float, open_price: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_limit_buy_order', 'order')
+        return self.broker.Order('create_limit_buy_order', symbol, volume, open_price)
+
+    async def create_limit_sell_order(self, symbol: str, volume: float, open_price: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_limit_sell_order', 'order')
+        return self.broker.Order('create_limit_sell_order', symbol, volume, open_price)
+
+    async def create_stop_buy_order(self, symbol: str, volume: float, open_price: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_stop_buy_order', 'order')
+        return self.broker.Order('create_stop_buy_order', symbol, volume, open_price)
+
+    async def create_stop_sell_order(self, symbol: str, volume: float, open_price: float, stop_loss: float = None, take_profit: float = None, options: dict = None) -> dict:
+        await self.broker.Call('create_stop_sell_order', 'order')
+        return self.broker.Order('create_stop_sell_order', symbol, volume, open_price)
+
+class FakeTerminalState:
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.connected = True
+        self.connected_to_broker = True
+
+    @property
+    def positions(self) -> list:
+        return list(self.broker.positions)
+
+class FakeStreamingConnection:
+    """Streams quotes of the subscribed symbols from the price feed to the synchronization listeners."""
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.listeners = []
+        self.symbols = set()
+        self.synchronized = False
+        self.terminal_state = FakeTerminalState(broker)
+        self.feed = None
+
+    def add_synchronization_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+    async def connect(self):
+        await self.broker.Call('connect')
+
+    async def wait_synchronized(self, options: dict = None):
+        await self.broker.Call('wait_synchronized')
+        self.synchronized = True
+
+        for listener in self.listeners:
+            await listener.on_account_information_updated('0', self.broker.AccountInformation())
+
+        if self.feed is None:
+            self.feed = asyncio.ensure_future(self.Feed())
+
+    async def subscribe_to_market_data(self, symbol: str, subscriptions: list = None, timeout_in_seconds: float = None, wait_for_quote: bool = True):
+        await self.broker.Call('subscribe_to_market_data')
+        self.symbols.add(symbol)
+
+        for listener in self.listeners:
+            await listener.on_symbol_price_updated('0', self.broker.prices.Price(symbol))
+
+    async def Feed(self) -> None:
+        while True:
+            await asyncio.sleep(self.broker.profile.tickInterval)
+
+            for symbol in sorted(self.symbols):
+                price = self.broker.prices.Step(symbol)
+                for listener in self.listeners:
+                    await listener.on_symbol_price_updated('0', price)
+
+    async def close(self):
+        self.synchronized = False
+
+        if self.feed is not None:
+            self.feed.cancel()
+            self.feed = None
+
+class FakeAccount:
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.id = broker.accountId
+        self.state = 'UNDEPLOYED'
+
+    async def deploy(self):
+        await self.broker.Call('deploy')
+        self.state = 'DEPLOYED'
+
+    async def undeploy(self):
+        await self.broker.Call('undeploy')
+        self.state = 'UNDEPLOYED'
+
+    async def wait_connected(self, timeout_in_seconds: float = 300, interval_in_milliseconds: float = 1000):
+        await self.broker.Call('wait_connected')
+
+    def get_rpc_connection(self) -> FakeRpcConnection:
+        return FakeRpcConnection(self.broker)
+
+    def get_streaming_connection(self) -> FakeStreamingConnection:
+        return FakeStreamingConnection(self.broker)
+
+class FakeAccountApi:
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.accounts = {}
+
+    async def get_account(self, account_id: str) -> FakeAccount:
+        if account_id not in self.accounts:
+            self.accounts[account_id] = FakeAccount(Broker(account_id, self.profile))
+
+        await self.accounts[account_id].broker.Call('get_account')
+        return self.accounts[account_id]
+
+class FakeMetaApi:
+    def __init__(self, token: str = None, opts: dict = None, profile: Profile = None):
+        self.profile = profile or Profile()
+        self.metatrader_account_api = FakeAccountApi(self.profile)
+
+    def Calls(self) -> dict:
+        """Returns how many times each call was made, over every account."""
+
+        calls = {}
+        for account in self.metatrader_account_api.accounts.values():
+            for name, count in account.broker.calls.items():
+                calls[name] = calls.get(name, 0) + count
+        return calls
+
+def Install(run, profile: Profile = None) -> FakeMetaApi:
+    """Makes run.py connect to a fake MetaApi instead of the cloud.
+
+    Arguments:
+        run: the imported run module
+        profile: configuration of the fake, Profile() by default
+
+    Returns:
+        the fake MetaApi shared by every account
+    """
+
+    fake = FakeMetaApi(profile=profile)
+    run.MetaApi = lambda token=None, opts=None: fake
+    run.metaApi = None
+
+    for manager in run.connectionManagers:
+        manager.api = None
+
+    return fake
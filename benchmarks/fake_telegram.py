@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Offline stand-in for the Telegram Bot API, for driving the handler stack of run.py without a network.
+
+FakeBot answers the API calls the handlers make locally and reports every message the bot sends, and
+CreateDispatcher runs the handlers registered by run.RegisterHandlers on a dispatcher fed with synthetic updates.
+CreateAsyncBot and SubmitAsync do the same for the ASYNC_DISPATCHER mode, where updates are handled on the event loop.
+
+Usage:
+    import fake_telegram
+    bot = fake_telegram.FakeBot()
+    dispatcher = fake_telegram.CreateDispatcher(run, bot)
+    dispatcher.update_queue.put(Update.de_json(fake_telegram.CreateUpdate(1, 1, '/trade', run.TELEGRAM_USER), bot))
+"""
+import asyncio
+import queue
+import threading
+import time
+
+from telegram import Bot
+from telegram.ext import Dispatcher
+from telegram.utils.helpers import DEFAULT_NONE
+
+class FakeBot(Bot):
+    """Bot that answers Telegram API calls locally and reports every message it sends.
+
+    Arguments:
+        latency: seconds every sent message blocks for, like the HTTPS request to Telegram would
+    """
+
+    def __init__(self, token: str = '123456:FAKE', latency: float = 0):
+        super().__init__(token)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.messageId = 0
+        # called with the chat id and text of every sent message
+        self.listeners = []
+
+    def _post(self, endpoint: str, data: dict = None, timeout=DEFAULT_NONE, api_kwargs: dict = None):
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Signal Bot', 'username': 'signal_bot'}
+
+        if endpoint != 'sendMessage':
+            return True
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.messageId += 1
+            messageId = self.messageId
+
+        for listener in self.listeners:
+            listener(data['chat_id'], data['text'])
+
+        return {'message_id': messageId, 'date': int(time.time()), 'chat': {'id': data['chat_id'], 'type': 'private'}, 'text': data['text']}
+
+def CreateUpdate(updateId: int, chatId: int, text: str, username: str, date: float = None) -> dict:
+    """Returns the JSON of a private text message update, as Telegram posts it to the webhook."""
+
+    message = {
+        'message_id': updateId,
+        'date': int(date or time.time()),
+        'chat': {'id': chatId, 'type': 'private', 'username': username},
+        'from': {'id': chatId, 'is_bot': False, 'first_name': username, 'username': username},
+        'text': text,
+    }
+
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+
+    return {'update_id': updateId, 'message': message}
+
+def CreateDispatcher(run, bot: Bot, workers: int = 4) -> Dispatcher:
+    """Starts a dispatcher with the handlers of the bot on a background thread.
+
+    Arguments:
+        run: the imported run module
+        bot: bot passed to the handlers
+        workers: number of worker threads of the dispatcher
+
+    Returns:
+        the running dispatcher, whose update_queue takes the updates
+    """
+
+    dispatcher = Dispatcher(bot, queue.Queue(), workers=workers, use_context=True)
+    run.RegisterHandlers(dispatcher)
+    threading.Thread(target=dispatcher.start, name='Dispatcher', daemon=True).start()
+    return dispatcher
+
+def CreateAsyncBot(run, latency: float = 0) -> Bot:
+    """Returns a run.AsyncBot that delivers its messages locally like FakeBot, without blocking the event loop.
+
+    Arguments:
+        run: the imported run module
+        latency: seconds every delivery takes, awaited on the event loop
+    """
+
+    class FakeAsyncBot(run.AsyncBot, FakeBot):
+        def __init__(self):
+            FakeBot.__init__(self, latency=latency)
+            self.session = None
+
+        async def Send(self, data: dict) -> None:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            for listener in self.listeners:
+                listener(data['chat_id'], data['text'])
+
+    return FakeAsyncBot()
+
+def SubmitAsync(run, dispatcher: Dispatcher, update) -> None:
+    """Hands an update to a dispatcher of run.CreateAsyncDispatcher on the event loop, like the aiohttp webhook does."""
+
+    run.eventLoop.call_soon_threadsafe(dispatcher.process_update, update)
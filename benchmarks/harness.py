@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Setup shared by the benchmarks, imported before run.py so that its configuration can be set first.
+
+Importing this module provides the environment run.py requires and puts the repository on the import path.
+
+Usage:
+    import harness
+    harness.UseFakeAccounts(3)
+    import run
+"""
+import json
+import os
+import sys
+
+os.environ.setdefault('RISK_FACTOR', '0.01')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def UseFakeAccounts(count: int) -> None:
+    """Configures run.py with a number of accounts of the offline MetaApi stand-in; called before importing run."""
+
+    os.environ['ACCOUNTS'] = json.dumps([{'AccountId': f'fake-{count}', 'Login': 1, 'Name': f'Account {count}'} for count in range(count)])
+
+def FormatPercentiles(samples: list, keys: tuple = ('p50', 'p95', 'p99')) -> str:
+    """Formats percentiles of durations in seconds as milliseconds, for example 'p50 1.2 ms  p95 3.4 ms'.
+
+    Arguments:
+        samples: durations in seconds
+        keys: percentiles to show, any key of run.Percentiles
+    """
+
+    # run reads its configuration when imported, so it is only imported once a benchmark has set it
+    import run
+
+    percentiles = run.Percentiles(samples)
+    return '  '.join(f'{key} {percentiles[key] * 1000:.1f} ms' for key in keys)
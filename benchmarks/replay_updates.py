@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Replays recorded Telegram updates against the handler stack of run.py with the offline MetaApi stand-in.
+
+Traffic is recorded by running the bot with RECORD_UPDATES set to a file, which receives one line per incoming
+update with its arrival time. The replay sends every update to a dispatcher with the handlers of the bot at
+its original pace, or faster, and reports how far the replay fell behind and how long each stage took.
+
+Usage:
+    python benchmarks/replay_updates.py updates.jsonl [--speed 1] [--accounts 1] [--time-scale 1]
+                                                      [--telegram-latency 0] [--user NAME] [--quiet 2]
+
+    --speed 1 replays at the original pace, 10 ten times faster and 0 as fast as possible.
+"""
+import argparse
+import copy
+import json
+import os
+import resource
+import time
+
+import harness
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='file recorded with RECORD_UPDATES')
+    parser.add_argument('--speed', type=float, default=1, help='replay speed relative to the recording, 0 for no delays')
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--time-scale', type=float, default=1, help='factor applied to every fake MetaApi delay')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='seconds every reply blocks for')
+    parser.add_argument('--user', help='authorized Telegram user, the sender of the first recorded message by default')
+    parser.add_argument('--quiet', type=float, default=2, help='seconds without replies after which the replay is done')
+    return parser.parse_args()
+
+def ReadRecords(path: str) -> list:
+    with open(path, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return sorted(records, key=lambda record: record['t'])
+
+def Sender(update: dict):
+    message = update.get('message') or update.get('edited_message') or {}
+    return message.get('chat', {}).get('username')
+
+arguments = ParseArguments()
+records = ReadRecords(arguments.path)
+
+# the accounts and the authorized user are read when run is imported
+harness.UseFakeAccounts(arguments.accounts)
+os.environ['TELEGRAM_USER'] = arguments.user or next((Sender(record['u']) for record in records if Sender(record['u'])), '')
+os.environ.pop('RECORD_UPDATES', None)
+
+import fake_metaapi
+import fake_telegram
+import run
+from telegram import Update
+
+def main() -> None:
+    if not records:
+        print('No updates recorded')
+        return
+
+    fake = fake_metaapi.Install(run, fake_metaapi.Profile(timeScale=arguments.time_scale))
+
+    for manager in run.connectionManagers:
+        run.SubmitCoroutine(manager.GetConnection()).result()
+
+    bot = fake_telegram.FakeBot(latency=arguments.telegram_latency)
+    replies = []
+    lastReply = [time.perf_counter()]
+
+    def Replied(chatId, text):
+        replies.append(text)
+        lastReply[0] = time.perf_counter()
+
+    bot.listeners.append(Replied)
+    dispatcher = fake_telegram.CreateDispatcher(run, bot)
+
+    first = records[0]['t']
+    lags = []
+    start = time.perf_counter()
+
+    for record in records:
+        if arguments.speed:
+            target = start + (record['t'] - first) / arguments.speed
+            time.sleep(max(0.0, target - time.perf_counter()))
+            lags.append(time.perf_counter() - target)
+
+        update = copy.deepcopy(record['u'])
+
+        # messages are dated now, so the receive latency measures the replay and not the age of the recording
+        for key in ('message', 'edited_message'):
+            if key in update:
+                update[key]['date'] = int(time.time())
+
+        dispatcher.update_queue.put(Update.de_json(update, bot))
+
+    sent = time.perf_counter() - start
+    lastReply[0] = max(lastReply[0], time.perf_counter())
+
+    while not dispatcher.update_queue.empty() or time.perf_counter() - lastReply[0] < arguments.quiet:
+        time.sleep(0.05)
+
+    elapsed = lastReply[0] - start
+    recorded = records[-1]['t'] - first
+
+    print(f'{len(records)} updates recorded over {recorded:.1f} s, sent in {sent:.1f} s, handled in {elapsed:.1f} s: {len(records) / elapsed:,.1f} updates/s')
+    if lags:
+        print(f"replay lag {harness.FormatPercentiles(lags, ('p50', 'p99', 'max'))}")
+    print(f'{len(replies)} replies')
+    print(f'memory high-water mark: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.1f} MiB')
+    print(f'\nLatency (ms)\n\n{run.latency.Summary()}')
+    print(f'\nMetaApi calls: {json.dumps(fake.Calls(), sort_keys=True)}')
+
+if __name__ == '__main__':
+    main()
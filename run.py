@@ -1,263 +1,1893 @@
 #!/usr/bin/env python3
 import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import http.server
+import json
 import logging
 import math
 import os
+import queue
+import random
+import re
+import threading
+import time
+
+from typing import List, Union
 
 try:
-    from typing import Literal
+    from typing import Literal, TypedDict
 except ImportError:
-    from typing_extensions import Literal
+    from typing_extensions import Literal, TypedDict
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+from metaapi_cloud_sdk import MetaApi, SynchronizationListener
+from metaapi_cloud_sdk.clients.metaApi.notConnectedException import NotConnectedException
+from metaapi_cloud_sdk.clients.metaApi.notSynchronizedException import NotSynchronizedException
+from metaapi_cloud_sdk.clients.timeoutException import TimeoutException
+from telegram import Bot, ParseMode, Update
+from telegram.error import TelegramError
+from telegram.ext import CommandHandler, Filters, MessageHandler, Updater, ConversationHandler, CallbackContext, Dispatcher, DispatcherHandlerStop, TypeHandler
+from telegram.utils.helpers import DEFAULT_NONE
+
+# MetaAPI Credentials
+API_KEY = os.environ.get("API_KEY")
+ACCOUNT_ID = os.environ.get("ACCOUNT_ID")
+
+# Telegram Credentials
+TOKEN = os.environ.get("TOKEN")
+TELEGRAM_USER = os.environ.get("TELEGRAM_USER")
+
+# Heroku Credentials
+APP_URL = os.environ.get("APP_URL")
+
+# Port number for Telegram bot web hook
+PORT = int(os.environ.get('PORT', '8443'))
+
+# Port number for the Prometheus metrics endpoint, disabled when not set
+METRICS_PORT = os.environ.get('METRICS_PORT')
+
+# Allowed MT4 Account Number
+ALLOWED_MT4_ACCOUNT_NUMBER = os.environ.get("4835673")
+
+# Enables logging
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# number of recent Telegram update ids remembered to drop redelivered updates
+UPDATE_HISTORY = 10000
+
+# File every incoming Telegram update is appended to with its arrival time, for replaying the traffic later; disabled when not set
+RECORD_UPDATES = os.environ.get('RECORD_UPDATES')
+
+# Serves the webhook, the handlers and the replies on the event loop of the MetaApi connections instead of the Updater threads
+ASYNC_DISPATCHER = os.environ.get('ASYNC_DISPATCHER', '').lower() in ('1', 'true', 'yes')
+
+# Number of threads sending the replies that coroutines on the event loop queue for Telegram
+REPLY_WORKERS = int(os.environ.get('REPLY_WORKERS', '4'))
+
+# Timeout in seconds of each request for the account information, prices, symbol specifications and positions of a trade
+DATA_TIMEOUT = float(os.environ.get('DATA_TIMEOUT', '10'))
+
+# Maximum age in seconds of a /calculate result that /yes enters without pricing and sizing the trades again
+SNAPSHOT_TOLERANCE = float(os.environ.get('SNAPSHOT_TOLERANCE', '30'))
+
+# possible states for conversation handler
+CALCULATE, TRADE, DECISION = range(3)
+
+# allowed FX symbols
+SYMBOLS = ['AUDCAD', 'AUDCHF', 'AUDJPY', 'AUDNZD', 'AUDUSD', 'CADCHF', 'CADJPY', 'CHFJPY', 'EURAUD', 'EURCAD', 'EURCHF', 'EURGBP', 'EURJPY', 'EURNZD', 'EURUSD', 'GBPAUD', 'GBPCAD', 'GBPCHF', 'GBPJPY', 'GBPNZD', 'GBPUSD', 'NOW', 'NZDCAD', 'NZDCHF', 'NZDJPY', 'NZDUSD', 'USDCAD', 'USDCHF', 'USDJPY', 'XAGUSD', 'XAUUSD']
+
+# hashed lookup of allowed symbols used while parsing signals
+SYMBOL_SET = frozenset(SYMBOLS)
+
+# order type keyword in the first line of a signal, e.g. "BUY LIMIT GBPUSD", and the order type of each group
+ORDER_TYPE_PATTERN = re.compile(r'(buy\slimit)|(sell\slimit)|(buy\sstop)|(sell\sstop)|(buy)|(sell)', re.IGNORECASE)
+ORDER_TYPES = (None, 'Buy Limit', 'Sell Limit', 'Buy Stop', 'Sell Stop', 'Buy', 'Sell')
+
+class Trade(TypedDict, total=False):
+    OrderType: Literal['Buy', 'Buy Limit', 'Buy Stop', 'Sell', 'Sell Limit', 'Sell Stop']
+    Symbol: str
+    Entry: Union[float, str]
+    StopLoss: float
+    TP: List[float]
+    RiskFactor: float
+    PositionSize: float
+    LegVolume: float
+
+# maximum length of a Telegram message
+MAX_MESSAGE_LENGTH = 4096
+
+# MetaApi order method for each order type and whether it takes an open price
+ORDER_METHODS = {
+    'Buy': ('create_market_buy_order', False),
+    'Buy Limit': ('create_limit_buy_order', True),
+    'Buy Stop': ('create_stop_buy_order', True),
+    'Sell': ('create_market_sell_order', False),
+    'Sell Limit': ('create_limit_sell_order', True),
+    'Sell Stop': ('create_stop_sell_order', True),
+}
+
+# RISK FACTOR
+RISK_FACTOR = float(os.environ.get("RISK_FACTOR"))
+
+# MetaTrader accounts every signal is copied to, as a JSON list of {"AccountId", "Login", "RiskFactor", "Name"},
+# defaults to the single account configured above
+ACCOUNTS = json.loads(os.environ.get('ACCOUNTS') or 'null') or [{'AccountId': ACCOUNT_ID, 'Login': ALLOWED_MT4_ACCOUNT_NUMBER, 'RiskFactor': RISK_FACTOR, 'Name': 'MetaTrader'}]
+
+# Maximum number of accounts priced and traded at the same time
+MAX_PARALLEL_ACCOUNTS = int(os.environ.get('MAX_PARALLEL_ACCOUNTS', '10'))
+
+def DefaultSymbolInfo(symbol: str) -> dict:
+    """Returns the sizing information used for a symbol until its broker specification is known."""
+
+    if symbol == 'XAUUSD':
+        pipSize = 0.1
+    elif symbol == 'XAGUSD':
+        pipSize = 0.001
+    elif symbol.endswith('JPY'):
+        pipSize = 0.01
+    else:
+        pipSize = 0.0001
+
+    # a standard FX lot is 100,000 units of the base currency, metal contract sizes vary by broker
+    contractSize = None if symbol in ('XAUUSD', 'XAGUSD') else 100000
+
+    return {'PipSize': pipSize, 'PipValue': 10, 'ContractSize': contractSize, 'ProfitCurrency': symbol[3:], 'VolumeStep': 0.01, 'MinVolume': 0.01, 'MaxVolume': None, 'Digits': None, 'Loaded': False}
+
+def SpecifiedSymbolInfo(symbol: str, specification: dict, currency: str) -> dict:
+    """Returns the sizing information of a symbol computed from its broker specification.
+
+    Arguments:
+        symbol: symbol of the specification
+        specification: MetaApi symbol specification
+        currency: account currency
+
+    Returns:
+        a dictionary with the pip size, pip value per lot and volume limits of the symbol
+    """
+
+    symbolInfo = DefaultSymbolInfo(symbol)
+    symbolInfo['Loaded'] = True
+    symbolInfo['Digits'] = specification.get('digits')
+    symbolInfo['PipSize'] = specification.get('pipSize') or symbolInfo['PipSize']
+    symbolInfo['VolumeStep'] = specification.get('volumeStep') or symbolInfo['VolumeStep']
+    symbolInfo['MinVolume'] = specification.get('minVolume') or symbolInfo['MinVolume']
+    symbolInfo['MaxVolume'] = specification.get('maxVolume')
+    symbolInfo['ContractSize'] = specification.get('contractSize')
+    symbolInfo['ProfitCurrency'] = specification.get('profitCurrency') or symbolInfo['ProfitCurrency']
+
+    # pip value is only known in the profit currency, so it can only be used as is when that is the account currency
+    if specification.get('contractSize') and specification.get('profitCurrency') == currency:
+        symbolInfo['PipValue'] = specification['contractSize'] * symbolInfo['PipSize']
+
+    return symbolInfo
+
+# pip size, pip value per lot and volume limits of every symbol, replaced by broker specifications once connected
+DEFAULT_SYMBOL_INFO = {symbol: DefaultSymbolInfo(symbol) for symbol in SYMBOLS}
+
+# Maximum age in seconds of a streamed quote before prices are requested over RPC instead
+QUOTE_MAX_AGE = float(os.environ.get('QUOTE_MAX_AGE', '5'))
+
+# Maximum age in seconds of cached account information before it is requested over RPC again
+ACCOUNT_INFO_TTL = float(os.environ.get('ACCOUNT_INFO_TTL', '30'))
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# number of recent measurements per stage kept for percentiles
+LATENCY_SAMPLES = 1000
+
+# Latency Instrumentation
+def Percentiles(samples) -> dict:
+    """Returns the count, p50, p95, p99 and maximum of a collection of measurements."""
+
+    samples = sorted(samples)
+
+    if not samples:
+        return {'count': 0}
+
+    def Percentile(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    return {'count': len(samples), 'p50': Percentile(0.5), 'p95': Percentile(0.95), 'p99': Percentile(0.99), 'max': samples[-1]}
+
+class LatencyRecorder:
+    """Histograms and recent samples of how long each stage of the signal-to-order pipeline takes."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def Record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            if stage not in self.histograms:
+                # one count per bucket plus the +Inf bucket, followed by the sum of all measurements
+                self.histograms[stage] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+                self.samples[stage] = collections.deque(maxlen=LATENCY_SAMPLES)
+
+            histogram = self.histograms[stage]
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+            self.samples[stage].append(seconds)
+
+        logger.debug(f'{stage} took {seconds * 1000:.1f} ms')
+
+    @contextlib.contextmanager
+    def Measure(self, stage: str):
+        """Records the time spent inside the with block under the given stage, using a monotonic clock."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.Record(stage, time.perf_counter() - start)
+
+    def Percentiles(self, stage: str) -> dict:
+        """Returns the count, p50, p95, p99 and maximum in seconds of the recent samples of a stage."""
+
+        with self.lock:
+            samples = list(self.samples.get(stage, ()))
+
+        return Percentiles(samples)
+
+    def Summary(self) -> str:
+        """Returns a fixed-width summary of the recent latency of every stage in milliseconds."""
+
+        lines = [f'{"Stage":<18}{"Count":>6}{"p50":>9}{"p95":>9}{"p99":>9}']
+
+        for stage in sorted(self.samples):
+            percentiles = self.Percentiles(stage)
+            lines.append(f'{stage:<18}{percentiles["count"]:>6}' + ''.join(f'{percentiles[key] * 1000:>9.1f}' for key in ('p50', 'p95', 'p99')))
+
+        return '\n'.join(lines)
+
+latency = LatencyRecorder()
+
+class CounterRecorder:
+    """Monotonic counters of pipeline events, optionally split by labels."""
+
+    def __init__(self):
+        self.counts = collections.defaultdict(float)
+        self.lock = threading.Lock()
+
+    def Increment(self, name: str, amount: float = 1, **labels) -> None:
+        with self.lock:
+            self.counts[name, tuple(sorted(labels.items()))] += amount
+
+    def Snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+counters = CounterRecorder()
+
+def FormatLabels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels) + '}'
+
+def RenderMetrics() -> str:
+    """Returns every counter and latency histogram in the Prometheus text exposition format."""
+
+    lines = []
+    names = set()
+
+    for (name, labels), value in sorted(counters.Snapshot().items()):
+        if name not in names:
+            names.add(name)
+            lines.append(f'# TYPE signalbot_{name} counter')
+        lines.append(f'signalbot_{name}{FormatLabels(labels)} {value}')
+
+    with latency.lock:
+        histograms = {stage: list(histogram) for stage, histogram in latency.histograms.items()}
+
+    lines.append('# TYPE signalbot_ready gauge')
+    for manager in connectionManagers:
+        lines.append(f'signalbot_ready{FormatLabels([("account", manager.name)])} {int(manager.ready.is_set())}')
+
+    lines.append('# TYPE signalbot_replies_pending gauge')
+    lines.append(f'signalbot_replies_pending {outbound.pending}')
+
+    lines.append('# TYPE signalbot_stage_latency_seconds histogram')
+
+    for stage, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+            cumulative += count
+            lines.append(f'signalbot_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'signalbot_stage_latency_seconds_sum{{stage="{stage}"}} {histogram[-1]}')
+        lines.append(f'signalbot_stage_latency_seconds_count{{stage="{stage}"}} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        body = RenderMetrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+def StartMetricsServer(port: int) -> http.server.ThreadingHTTPServer:
+    """Serves /metrics on the given port from a background thread."""
+
+    server = http.server.ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='Metrics', daemon=True).start()
+    logger.info(f'Serving metrics on port {port}')
+    return server
+
+# Seconds between keepalive checks of the MetaTrader connection, and the timeout of each check
+KEEPALIVE_INTERVAL = float(os.environ.get('KEEPALIVE_INTERVAL', '60'))
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', '10'))
+
+# Longest delay in seconds between reconnect attempts
+RECONNECT_MAX_DELAY = float(os.environ.get('RECONNECT_MAX_DELAY', '300'))
+
+# Seconds without trading activity after which the account is undeployed to save hosting cost, 0 keeps it deployed
+IDLE_UNDEPLOY_AFTER = float(os.environ.get('IDLE_UNDEPLOY_AFTER', '0'))
+
+# Comma separated UTC start times (HH:MM) of trading sessions, and how many seconds ahead of them the account is deployed
+TRADING_SESSIONS = [datetime.time.fromisoformat(session.strip()) for session in os.environ.get('TRADING_SESSIONS', '').split(',') if session.strip()]
+SESSION_LEAD = float(os.environ.get('SESSION_LEAD', '600'))
+
+# errors after which the MetaApi connection is dropped and established again
+CONNECTION_ERRORS = (NotConnectedException, NotSynchronizedException, TimeoutException)
+
+def SessionStartsWithin(seconds: float) -> bool:
+    """Returns whether one of the trading sessions starts within the given number of seconds."""
+
+    now = datetime.datetime.utcnow()
+
+    for session in TRADING_SESSIONS:
+        start = datetime.datetime.combine(now.date(), session)
+        if start < now:
+            start += datetime.timedelta(days=1)
+        if (start - now).total_seconds() <= seconds:
+            return True
+
+    return False
+
+def ReconnectDelay(failures: int) -> float:
+    """Returns the jittered exponential backoff delay in seconds after a number of consecutive failures."""
+
+    return min(RECONNECT_MAX_DELAY, 5 * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+
+# MetaTrader Connection
+class PipValues:
+    """Pip value per lot of every symbol in the account currency, kept current from the quotes.
+
+    Every currency is held as its rate against USD, taken from the quotes of its USD pair, and cross rates are
+    triangulated through USD. A tick only reprices the symbols whose profit currency it moved, or every symbol
+    when it moved the account currency, so looking up a pip value is a single dictionary access.
+    """
+
+    def __init__(self):
+        self.currency = None
+        self.usdRates = {'USD': 1.0}
+        # symbol: (profit currency, pip value per lot in the profit currency)
+        self.definitions = {}
+        self.symbolsByCurrency = collections.defaultdict(set)
+        self.pipValues = {}
+
+    def SetCurrency(self, currency: str) -> None:
+        if currency != self.currency:
+            self.currency = currency
+            self.Reprice(self.definitions)
+
+    def SetSymbol(self, symbol: str, symbolInfo: dict) -> None:
+        """Registers the contract of a symbol, or forgets it when its contract size is unknown."""
+
+        previous = self.definitions.pop(symbol, None)
+
+        if previous is not None:
+            self.symbolsByCurrency[previous[0]].discard(symbol)
+
+        self.pipValues.pop(symbol, None)
+
+        if symbolInfo['ContractSize'] is None:
+            return
+
+        self.definitions[symbol] = (symbolInfo['ProfitCurrency'], symbolInfo['ContractSize'] * symbolInfo['PipSize'])
+        self.symbolsByCurrency[symbolInfo['ProfitCurrency']].add(symbol)
+        self.Reprice([symbol])
+
+    def Update(self, symbol: str, bid: float, ask: float) -> None:
+        base, quote = symbol[:3], symbol[3:]
+
+        if quote == 'USD':
+            currency, rate = base, (bid + ask) / 2
+        elif base == 'USD':
+            currency, rate = quote, 2 / (bid + ask)
+        else:
+            # every currency of SYMBOLS has a USD pair, so crosses are not needed for triangulation
+            return
+
+        self.usdRates[currency] = rate
+        self.Reprice(self.definitions if currency == self.currency else self.symbolsByCurrency[currency])
+
+    def Rate(self, fromCurrency: str, toCurrency: str):
+        """Returns how many units of toCurrency one unit of fromCurrency is worth, or None if a rate is missing."""
+
+        fromRate = self.usdRates.get(fromCurrency)
+        toRate = self.usdRates.get(toCurrency)
+
+        if fromRate is None or toRate is None:
+            return None
+
+        return fromRate / toRate
+
+    def Reprice(self, symbols) -> None:
+        for symbol in symbols:
+            profitCurrency, pipValue = self.definitions[symbol]
+            rate = 1.0 if profitCurrency == self.currency else self.Rate(profitCurrency, self.currency)
+
+            if rate is None:
+                self.pipValues.pop(symbol, None)
+            else:
+                self.pipValues[symbol] = pipValue * rate
+
+    def Get(self, symbol: str):
+        """Returns the pip value per lot of a symbol in the account currency, or None if it cannot be converted yet."""
+
+        return self.pipValues.get(symbol)
+
+class QuoteCache(SynchronizationListener):
+    """Latest bid and ask of every subscribed symbol, kept up to date by the streaming connection."""
+
+    def __init__(self, pipValues: PipValues = None):
+        super().__init__()
+        self.quotes = {}
+        self.pipValues = pipValues
+
+    async def on_symbol_price_updated(self, instance_index: str, price: dict):
+        self.Update(price)
+
+    def Update(self, price: dict) -> None:
+        self.quotes[price['symbol']] = (price['bid'], price['ask'], time.monotonic())
+
+        if self.pipValues is not None:
+            self.pipValues.Update(price['symbol'], price['bid'], price['ask'])
+
+    def Get(self, symbol: str, maxAge: float):
+        """Returns the cached quote of a symbol.
+
+        Arguments:
+            symbol: symbol to look up
+            maxAge: maximum age of the quote in seconds
+
+        Returns:
+            a dictionary with the bid and ask, or None if there is no quote younger than maxAge
+        """
+
+        quote = self.quotes.get(symbol)
+
+        if quote is None or time.monotonic() - quote[2] > maxAge:
+            return None
+
+        return {'symbol': symbol, 'bid': quote[0], 'ask': quote[1]}
+
+class AccountCache(SynchronizationListener):
+    """Snapshot of the account information, refreshed by streaming synchronization events."""
+
+    def __init__(self):
+        super().__init__()
+        self.accountInformation = None
+        self.updated = 0
+
+    async def on_account_information_updated(self, instance_index: str, account_information: dict):
+        self.Update(account_information)
+
+    def Update(self, accountInformation: dict) -> None:
+        self.accountInformation = accountInformation
+        self.updated = time.monotonic()
+
+    def Get(self, maxAge: float):
+        """Returns the cached account information, or None if it is older than maxAge seconds."""
+
+        if self.accountInformation is None or time.monotonic() - self.updated > maxAge:
+            return None
+
+        return self.accountInformation
+
+metaApi = None
+
+def SharedMetaApi() -> MetaApi:
+    """Returns the MetaApi client shared by every account, so all accounts use a single websocket client."""
+
+    global metaApi
+
+    if metaApi is None:
+        metaApi = MetaApi(API_KEY)
+    return metaApi
+
+class ConnectionManager:
+    """Keeps one MetaApi account and RPC connection alive for the lifetime of the bot.
+
+    The account is deployed and synchronized once, after which every signal reuses the same
+    ready connection instead of paying the connect and synchronization cost again.
+    """
+
+    def __init__(self, accountId: str, allowedLogin=None, riskFactor: float = RISK_FACTOR, name: str = 'MetaTrader'):
+        self.accountId = accountId
+        # MT4 login the account must report before any trade is sized or placed on it
+        self.allowedLogin = int(allowedLogin) if allowedLogin else None
+        self.riskFactor = riskFactor
+        self.name = name
+        self.api = None
+        self.account = None
+        self.connection = None
+        self.streamingConnection = None
+        self.pipValues = PipValues()
+        self.quotes = QuoteCache(self.pipValues)
+        self.accountCache = AccountCache()
+        self.symbols = dict(DEFAULT_SYMBOL_INFO)
+
+        for symbol, symbolInfo in self.symbols.items():
+            if symbol != 'NOW':
+                self.pipValues.SetSymbol(symbol, symbolInfo)
+        self.lock = None
+        # number of order blocks using each RPC connection, and the dropped connections closed once their orders finish
+        self.users = collections.Counter()
+        self.retired = set()
+        # set once the account is deployed, connected and synchronized, read by the Telegram handlers
+        self.ready = threading.Event()
+        self.undeployed = False
+        self.lastActivity = time.monotonic()
+        self.unhealthyChecks = 0
+
+    async def Connect(self) -> None:
+        """Deploys the MetaTrader account if needed and opens a synchronized RPC connection.
+
+        The connection is only published once the account information and symbols are loaded. A failed or
+        cancelled connect closes whatever it opened, so the next request connects again instead of returning a
+        connection that never became ready.
+        """
+
+        if self.api is None:
+            self.api = SharedMetaApi()
+
+        if self.account is not None:
+            counters.Increment('metaapi_reconnects_total')
+
+        connection = None
+
+        try:
+            self.account = await self.api.metatrader_account_api.get_account(self.accountId)
+            initial_state = self.account.state
+            deployed_states = ['DEPLOYING', 'DEPLOYED']
+
+            if initial_state not in deployed_states:
+                logger.info(f'{self.name}: Deploying account')
+                with latency.Measure('deploy'):
+                    await self.account.deploy()
+
+            logger.info(f'{self.name}: Waiting for API server to connect to broker ...')
+            with latency.Measure('wait_connected'):
+                await self.account.wait_connected()
+
+            connection = self.account.get_rpc_connection()
+            with latency.Measure('connect'):
+                await connection.connect()
+
+            logger.info(f'{self.name}: Waiting for SDK to synchronize to terminal state ...')
+            with latency.Measure('sync'):
+                await connection.wait_synchronized()
+
+            self.accountCache.Update(await connection.get_account_information())
+            self.pipValues.SetCurrency(self.accountCache.accountInformation.get('currency'))
+            await self.LoadSymbols(connection)
+            logger.info(f'{self.name}: MetaTrader connection established')
+
+            try:
+                await self.Stream()
+            except Exception as error:
+                logger.warning(f'{self.name}: Could not open streaming connection, prices will be requested over RPC: {error}')
+
+        except BaseException:
+            await self.CloseConnections([connection, self.streamingConnection])
+            self.streamingConnection = None
+            raise
+
+        self.connection = connection
+        self.undeployed = False
+        self.ready.set()
+
+    async def LoadSymbols(self, connection) -> None:
+        """Fetches the specification of every allowed symbol and precomputes its sizing information."""
+
+        symbols = [symbol for symbol in SYMBOLS if symbol != 'NOW']
+        specifications = await asyncio.gather(*[connection.get_symbol_specification(symbol) for symbol in symbols], return_exceptions=True)
+        currency = self.accountCache.accountInformation.get('currency')
+
+        for symbol, specification in zip(symbols, specifications):
+            if isinstance(specification, Exception):
+                logger.warning(f'Could not load {symbol} specification, using defaults: {specification}')
+                continue
+
+            self.symbols[symbol] = SpecifiedSymbolInfo(symbol, specification, currency)
+            self.pipValues.SetSymbol(symbol, self.symbols[symbol])
+
+    async def Stream(self) -> None:
+        """Opens the streaming connection and subscribes to quotes for every allowed symbol."""
+
+        streamingConnection = self.account.get_streaming_connection()
+        streamingConnection.add_synchronization_listener(self.quotes)
+        streamingConnection.add_synchronization_listener(self.accountCache)
+
+        try:
+            await streamingConnection.connect()
+            await streamingConnection.wait_synchronized()
+        except BaseException:
+            await self.CloseConnections([streamingConnection])
+            raise
+
+        self.streamingConnection = streamingConnection
+
+        symbols = [symbol for symbol in SYMBOLS if symbol != 'NOW']
+        results = await asyncio.gather(*[streamingConnection.subscribe_to_market_data(symbol, wait_for_quote=False) for symbol in symbols], return_exceptions=True)
+
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                logger.warning(f'Could not subscribe to {symbol} quotes: {result}')
+
+    async def GetConnection(self, touch: bool = True):
+        """Returns the shared RPC connection, connecting first if there is none yet.
+
+        Arguments:
+            touch: whether the request counts as trading activity for the idle undeploy
+
+        Returns:
+            the synchronized MetaApi RPC connection
+        """
+
+        if touch:
+            self.lastActivity = time.monotonic()
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            if self.connection is None:
+                await self.Connect()
+
+        return self.connection
+
+    @contextlib.asynccontextmanager
+    async def Trading(self):
+        """Yields the connection for placing orders, which Reset only closes once every such block has ended."""
+
+        with latency.Measure('connection'):
+            connection = await self.GetConnection()
+
+        self.users[connection] += 1
+
+        try:
+            yield connection
+        finally:
+            self.users[connection] -= 1
+
+            if not self.users[connection]:
+                del self.users[connection]
+                if connection in self.retired:
+                    self.retired.discard(connection)
+                    await self.CloseConnections([connection])
+
+    async def GetAccountInformation(self, maxAge: float = ACCOUNT_INFO_TTL) -> dict:
+        """Returns the account information, from the account cache when it is younger than maxAge seconds."""
+
+        accountInformation = self.accountCache.Get(maxAge)
+
+        if accountInformation is None:
+            connection = await self.GetConnection()
+            with latency.Measure('account_rpc'):
+                accountInformation = await connection.get_account_information()
+            self.accountCache.Update(accountInformation)
+
+        return accountInformation
+
+    async def GetSymbolInfo(self, symbol: str) -> dict:
+        """Returns the sizing information of a symbol, fetching its specification if it was not loaded on connect.
+
+        The pip value is converted to the account currency with the latest quotes, requesting the prices of the
+        USD pairs needed for the conversion when they are not streamed.
+        """
+
+        symbolInfo = self.symbols[symbol]
+
+        if not symbolInfo['Loaded']:
+            connection = await self.GetConnection()
+            specification = await connection.get_symbol_specification(symbol)
+            accountInformation = await self.GetAccountInformation()
+            symbolInfo = self.symbols[symbol] = SpecifiedSymbolInfo(symbol, specification, accountInformation.get('currency'))
+            self.pipValues.SetSymbol(symbol, symbolInfo)
+
+        if symbolInfo['ContractSize'] is None:
+            return symbolInfo
+
+        pipValue = self.pipValues.Get(symbol)
+
+        if pipValue is None:
+            if self.pipValues.currency is None:
+                self.pipValues.SetCurrency((await self.GetAccountInformation()).get('currency'))
+
+            missing = {symbolInfo['ProfitCurrency'], self.pipValues.currency} - set(self.pipValues.usdRates)
+            pairs = [pair for currency in missing for pair in (f'{currency}USD', f'USD{currency}') if pair in SYMBOL_SET]
+            await asyncio.gather(*[self.GetPrice(pair) for pair in pairs])
+            pipValue = self.pipValues.Get(symbol)
+
+        if pipValue is None:
+            return symbolInfo
+
+        return dict(symbolInfo, PipValue=pipValue)
+
+    async def GetPositions(self) -> list:
+        """Returns the open positions, from the streaming terminal state when it is synchronized."""
+
+        if self.streamingConnection is not None and self.streamingConnection.synchronized:
+            return self.streamingConnection.terminal_state.positions
+
+        connection = await self.GetConnection()
+        return await connection.get_positions()
+
+    async def GetPrice(self, symbol: str) -> dict:
+        """Returns the latest price of a symbol, from the quote cache when it is fresh enough.
+
+        Arguments:
+            symbol: symbol to price
+
+        Returns:
+            a dictionary with the bid and ask of the symbol
+        """
+
+        price = self.quotes.Get(symbol, QUOTE_MAX_AGE)
+
+        if price is None:
+            connection = await self.GetConnection()
+            with latency.Measure('price_rpc'):
+                price = await connection.get_symbol_price(symbol=symbol)
+            self.quotes.Update(price)
+
+        return price
+
+    async def IsHealthy(self) -> bool:
+        """Checks that the terminal is connected and synchronized and that the RPC connection answers a keepalive."""
+
+        streamingConnection = self.streamingConnection
+
+        if streamingConnection is not None:
+            terminalState = streamingConnection.terminal_state
+            if not terminalState.connected or not terminalState.connected_to_broker or not streamingConnection.synchronized:
+                return False
+
+        with latency.Measure('keepalive'):
+            await asyncio.wait_for(self.connection.get_server_time(), KEEPALIVE_TIMEOUT)
+
+        return True
+
+    async def Undeploy(self) -> None:
+        """Closes the connections and undeploys the account, which is deployed again on the next request."""
+
+        logger.info(f'{self.name}: Undeploying idle MetaTrader account')
+        await self.Reset()
+        await self.account.undeploy()
+        self.undeployed = True
+        counters.Increment('metaapi_undeploys_total')
+
+    async def Maintain(self) -> None:
+        """Keeps the connection hot for the trade path for as long as the bot runs.
+
+        Sends keepalives, reconnects with jittered backoff when the broker connection or synchronization is lost,
+        undeploys the account after IDLE_UNDEPLOY_AFTER seconds without activity and deploys it again ahead of
+        the configured trading sessions.
+        """
+
+        failures = 0
+        delay = KEEPALIVE_INTERVAL
+
+        while True:
+            await asyncio.sleep(delay)
+
+            if self.undeployed:
+                if not SessionStartsWithin(SESSION_LEAD):
+                    continue
+                logger.info(f'{self.name}: Trading session starts soon, deploying MetaTrader account')
+
+            elif self.connection is not None and IDLE_UNDEPLOY_AFTER and time.monotonic() - self.lastActivity > IDLE_UNDEPLOY_AFTER and not SessionStartsWithin(SESSION_LEAD):
+                try:
+                    await self.Undeploy()
+                except Exception as error:
+                    logger.error(f'{self.name}: Could not undeploy MetaTrader account: {error}')
+                continue
+
+            healthy = True
+
+            if self.connection is not None:
+                try:
+                    healthy = await self.IsHealthy()
+                except Exception as error:
+                    logger.warning(f'{self.name}: MetaTrader keepalive failed: {error}')
+                    healthy = False
+
+            if healthy:
+                self.unhealthyChecks = 0
+            else:
+                self.unhealthyChecks += 1
+                # the SDK recovers short broker disconnects by itself, so only a persistent problem triggers a reconnect
+                if self.unhealthyChecks >= 2:
+                    logger.warning(f'{self.name}: MetaTrader connection failed {self.unhealthyChecks} health checks in a row, reconnecting')
+                    counters.Increment('metaapi_health_failures_total')
+                    await self.Reset()
+
+            try:
+                await self.GetConnection(touch=self.undeployed)
+                failures = 0
+                delay = KEEPALIVE_INTERVAL
+
+            except Exception as error:
+                failures += 1
+                # drawn once, as the backoff is jittered, so the logged delay is the one slept
+                delay = ReconnectDelay(failures)
+                logger.error(f'{self.name}: Could not reconnect to MetaTrader, retrying in {delay:.0f} s: {error}')
+                counters.Increment('metaapi_health_failures_total')
+                await self.Reset()
+
+    async def ReportFailure(self, error: Exception) -> None:
+        """Drops the connection when a trade failed because of it, so the next request reconnects."""
+
+        if isinstance(error, CONNECTION_ERRORS):
+            await self.Reset()
+
+    async def Reset(self) -> None:
+        """Drops the current connections so that the next request establishes fresh ones.
+
+        Waits for a connect in progress, and leaves an RPC connection that orders are still being placed on open
+        until they finish.
+        """
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            self.ready.clear()
+            self.unhealthyChecks = 0
+            connection, streamingConnection = self.connection, self.streamingConnection
+            self.connection = self.streamingConnection = None
+
+        if connection is not None and self.users[connection]:
+            self.retired.add(connection)
+            connection = None
+
+        await self.CloseConnections([connection, streamingConnection])
+
+    async def CloseConnections(self, connections: list) -> None:
+        for connection in connections:
+            if connection is None:
+                continue
+            try:
+                await connection.close()
+            except Exception as error:
+                logger.warning(f'Error while closing MetaTrader connection: {error}')
+
+# one connection manager per configured account, each with its own connections, caches and lifecycle
+connectionManagers = [ConnectionManager(account['AccountId'], account.get('Login'), float(account.get('RiskFactor', RISK_FACTOR)), account.get('Name') or account['AccountId']) for account in ACCOUNTS]
+
+# the MetaApi connection is bound to the event loop it was created on, so every coroutine runs on this one loop
+eventLoop = asyncio.new_event_loop()
+eventLoopThread = threading.Thread(target=eventLoop.run_forever, name='EventLoop', daemon=True)
+eventLoopLock = threading.Lock()
+
+def SubmitCoroutine(coroutine) -> concurrent.futures.Future:
+    """Schedules a coroutine on the background event loop without waiting for it.
+
+    Arguments:
+        coroutine: coroutine to run
+
+    Returns:
+        a future that resolves with the result of the coroutine
+    """
+
+    with eventLoopLock:
+        if not eventLoopThread.is_alive():
+            eventLoopThread.start()
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, eventLoop)
+    future.add_done_callback(LogFailure)
+    return future
+
+def LogFailure(future: concurrent.futures.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f'Background task failed: {future.exception()}')
+
+async def Startup(manager: ConnectionManager) -> None:
+    """Deploys, connects and synchronizes a MetaTrader account, retrying until it is ready."""
+
+    delay = 5
+
+    while True:
+        try:
+            with latency.Measure('startup'):
+                await manager.GetConnection()
+            break
+        except Exception as error:
+            logger.error(f'{manager.name}: Could not connect to MetaTrader on startup, retrying in {delay} s: {error}')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 300)
+
+    logger.info(f'{manager.name}: Account is ready')
+
+    if all(other.ready.is_set() for other in connectionManagers):
+        logger.info('Bot is ready')
+
+    await manager.Maintain()
+
+async def MonitorEventLoop(interval: float = 1) -> None:
+    """Records how late the event loop wakes up from a sleep, which shows how long coroutines block it."""
+
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        latency.Record('event_loop_lag', max(0.0, time.perf_counter() - start - interval))
+
+class UpdateDeduplicator:
+    """Remembers the most recent Telegram update ids so that redelivered updates are only handled once."""
+
+    def __init__(self, size: int):
+        self.seen = set()
+        self.order = collections.deque()
+        self.size = size
+        self.lock = threading.Lock()
+
+    def IsDuplicate(self, updateId: int) -> bool:
+        with self.lock:
+            if updateId in self.seen:
+                return True
+
+            self.seen.add(updateId)
+            self.order.append(updateId)
+
+            if len(self.order) > self.size:
+                self.seen.discard(self.order.popleft())
+
+            return False
+
+deduplicator = UpdateDeduplicator(UPDATE_HISTORY)
+
+def CompactUpdate(value):
+    """Drops the empty lists PTB fills into serialized updates, which Update.de_json restores."""
+
+    if isinstance(value, dict):
+        return {key: CompactUpdate(item) for key, item in value.items() if item != [] and item is not None}
+    if isinstance(value, list):
+        return [CompactUpdate(item) for item in value]
+    return value
+
+class UpdateRecorder:
+    """Appends every incoming Telegram update to a JSON lines file, one {"t": arrival time, "u": update} per line."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.lock = threading.Lock()
+
+    def Record(self, update: Update) -> None:
+        line = json.dumps({'t': round(time.time(), 3), 'u': CompactUpdate(update.to_dict())}, separators=(',', ':'), ensure_ascii=False)
+
+        with self.lock:
+            self.file.write(line + '\n')
+
+recorder = UpdateRecorder(RECORD_UPDATES) if RECORD_UPDATES else None
+
+class OutboundQueue:
+    """Delivers Telegram messages on the event loop without the coroutine that sends them waiting for Telegram.
+
+    Every message waits for the previous message to the same chat, so the replies of a chat keep their order
+    while other chats, and the trades that queued them, carry on.
+    """
+
+    def __init__(self):
+        # last queued delivery of each chat, which the next message to the chat waits for
+        self.deliveries = {}
+        self.pending = 0
+
+    def Put(self, chatId: int, send) -> asyncio.Task:
+        """Queues a message for a chat; called on the event loop.
+
+        Arguments:
+            chatId: chat the message is sent to
+            send: function returning an awaitable that sends the message
+
+        Returns:
+            the task delivering the message
+        """
+
+        self.pending += 1
+        task = eventLoop.create_task(self.Deliver(chatId, send, self.deliveries.get(chatId)))
+        self.deliveries[chatId] = task
+        return task
+
+    async def Deliver(self, chatId: int, send, previous: asyncio.Task) -> None:
+        if previous is not None:
+            await previous
+
+        try:
+            with latency.Measure('reply_delivery'):
+                await send()
+        except Exception as error:
+            logger.error(f'Could not send message to chat {chatId}: {error}')
+            counters.Increment('replies_failed_total')
+        finally:
+            self.pending -= 1
+            if self.deliveries.get(chatId) is asyncio.current_task():
+                del self.deliveries[chatId]
+
+outbound = OutboundQueue()
+
+# python-telegram-bot sends synchronously, so queued replies are sent from these threads instead of the event loop
+replyExecutor = concurrent.futures.ThreadPoolExecutor(REPLY_WORKERS, thread_name_prefix='Reply')
+
+class AsyncBot(Bot):
+    """Bot that sends the messages of handlers running on the event loop with aiohttp instead of blocking the loop.
+
+    A message sent from the event loop is queued on the outbound queue and the call returns at once, so the
+    handler or the trade never waits for Telegram. Other API calls, and calls from other threads, are sent
+    synchronously as usual.
+    """
+
+    def __init__(self, token: str):
+        super().__init__(token)
+        self.session = None
+        self.messageId = 0
+
+    def _post(self, endpoint: str, data: dict = None, timeout=DEFAULT_NONE, api_kwargs: dict = None):
+        if endpoint != 'sendMessage' or threading.current_thread() is not eventLoopThread:
+            return super()._post(endpoint, data, timeout, api_kwargs)
+
+        data = dict(data or {}, **(api_kwargs or {}))
+        self._insert_defaults(data, timeout)
+        data = {key: value for key, value in data.items() if value is not None}
+
+        chatId = data['chat_id']
+        outbound.Put(chatId, lambda: self.Send(data))
+        self.messageId += 1
+
+        # the message is not sent yet, so handlers get a placeholder of the message instead of the one Telegram returns
+        return {'message_id': self.messageId, 'date': int(time.time()), 'chat': {'id': chatId, 'type': 'private'}, 'text': data.get('text')}
+
+    async def Send(self, data: dict) -> None:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DATA_TIMEOUT))
+
+        async with self.session.post(f'{self.base_url}/sendMessage', json=data) as response:
+            result = await response.json()
+
+        if not result.get('ok'):
+            raise TelegramError(result.get('description', f'HTTP {response.status}'))
+
+# Helper Functions
+def ParseSignal(signal: str) -> Trade:
+    """Starts process of parsing signal and entering trade on MetaTrader account.
+
+    Arguments:
+        signal: trading signal
+
+    Returns:
+        a dictionary that contains trade signal information
+    """
+
+    lines = signal.split('\n', 5)
+    match = ORDER_TYPE_PATTERN.search(lines[0])
+
+    if match is None:
+        return {}
+
+    symbol = lines[0].split()[-1].upper()
+
+    if symbol not in SYMBOL_SET:
+        return {}
+
+    # the entry, stop loss and take profits are the last word of their line
+    words = [line.split()[-1] for line in lines[1:5]]
+
+    if len(words) < 3:
+        raise ValueError('Missing entry, stop loss or take profit')
+
+    orderType = ORDER_TYPES[match.lastindex]
+
+    trade: Trade = {
+        'OrderType': orderType,
+        'Symbol': symbol,
+        'Entry': words[0] if orderType == 'Buy' or orderType == 'Sell' else float(words[0]),
+        'StopLoss': float(words[1]),
+        'TP': [float(words[2])] if len(words) == 3 else [float(words[2]), float(words[3])],
+        'RiskFactor': RISK_FACTOR,
+    }
+
+    return trade
+
+def SplitSignals(message: str) -> List[str]:
+    """Splits a message into signal blocks, separated by blank lines or by a new order line.
+
+    Arguments:
+        message: message that contains one or more trading signals
+
+    Returns:
+        the text of every signal in the message
+    """
+
+    blocks = [[]]
+
+    for line in message.split('\n'):
+        if not line.strip():
+            if blocks[-1]:
+                blocks.append([])
+        elif len(blocks[-1]) >= 4 and ORDER_TYPE_PATTERN.match(line.lstrip()):
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+
+    return ['\n'.join(block) for block in blocks if block]
+
+def ParseSignals(message: str) -> List[Trade]:
+    """Parses every trading signal in a message.
+
+    Arguments:
+        message: message that contains one or more trading signals
+
+    Returns:
+        a list with the trade information of every signal, in message order
+    """
+
+    signals = SplitSignals(message) or [message]
+    trades = []
+
+    for count, signal in enumerate(signals):
+        try:
+            trade = ParseSignal(signal)
+            if not trade:
+                raise Exception('Invalid Trade')
+        except Exception as error:
+            if len(signals) == 1:
+                raise
+            raise Exception(f'Signal {count + 1}: {error}')
+
+        trades.append(trade)
+
+    return trades
+
+def SizePositions(balances, riskFactors, entries, stopLosses, takeProfits, pipSizes, pipValues, volumeSteps, maxVolumes) -> dict:
+    """Sizes any number of trades in one vectorized call.
+
+    Every argument is an array with one value per trade, except takeProfits, which has one row of take profits
+    per trade padded with NaN. A trade without a maximum volume has a maxVolumes entry of inf.
+
+    Returns:
+        a dictionary of arrays with the stop loss and take profit distances in pips, the volume of each take
+        profit leg rounded down to the volume step, the position size of all legs together, the potential loss
+        and the profit of every take profit leg and in total
+    """
+
+    stopLossPips = np.abs(np.rint((stopLosses - entries) / pipSizes))
+    takeProfitPips = np.abs(np.rint((takeProfits - entries[:, None]) / pipSizes[:, None]))
+    legs = np.count_nonzero(~np.isnan(takeProfits), axis=1)
+
+    # each take profit leg is a separate order for an equal share of the position, so every leg is on the volume step
+    steps = np.floor(np.round(balances * riskFactors / stopLossPips / pipValues / legs / volumeSteps, 6))
+    legVolumes = np.minimum(np.round(steps * volumeSteps, 8), maxVolumes)
+    positionSizes = np.round(legVolumes * legs, 8)
+
+    profits = np.round(legVolumes[:, None] * pipValues[:, None] * takeProfitPips, 2)
+
+    return {
+        'StopLossPips': stopLossPips,
+        'TakeProfitPips': takeProfitPips,
+        'LegVolume': legVolumes,
+        'PositionSize': positionSizes,
+        'PotentialLoss': np.round(positionSizes * pipValues * stopLossPips, 2),
+        'Profits': profits,
+        'TotalProfit': np.nansum(profits, axis=1),
+    }
+
+def SizeTrades(rows: list) -> list:
+    """Sizes trades of any number of accounts at once and stores the position size and leg volume in each trade.
 
-from metaapi_cloud_sdk import MetaApi
-from prettytable import PrettyTable
-from telegram import ParseMode, Update
-from telegram.ext import CommandHandler, Filters, MessageHandler, Updater, ConversationHandler, CallbackContext
+    Arguments:
+        rows: (trade, balance, symbol information) of every trade to size
 
-# MetaAPI Credentials
-API_KEY = os.environ.get("API_KEY")
-ACCOUNT_ID = os.environ.get("ACCOUNT_ID")
+    A trade whose stop loss is at the entry price, or whose take profit legs are below the minimum volume,
+    cannot be sized; its sizing only holds the reason and its position size is left unset, so the other trades
+    are still sized and entered.
 
-# Telegram Credentials
-TOKEN = os.environ.get("TOKEN")
-TELEGRAM_USER = os.environ.get("TELEGRAM_USER")
+    Returns:
+        the sizing of every trade, with the pip distances, potential loss and profits used by its table and an
+        Error that is None unless the trade cannot be sized
+    """
 
-# Heroku Credentials
-APP_URL = os.environ.get("APP_URL")
+    if not rows:
+        return []
 
-# Port number for Telegram bot web hook
-PORT = int(os.environ.get('PORT', '8443'))
+    with latency.Measure('sizing'):
+        values = np.array([
+            (balance, trade['RiskFactor'], trade['Entry'], trade['StopLoss'], symbolInfo['PipSize'], symbolInfo['PipValue'], symbolInfo['VolumeStep'],
+             np.inf if symbolInfo['MaxVolume'] is None else symbolInfo['MaxVolume'], symbolInfo['MinVolume'] or 0)
+            for trade, balance, symbolInfo in rows
+        ], dtype=float)
 
-# Allowed MT4 Account Number
-ALLOWED_MT4_ACCOUNT_NUMBER = os.environ.get("4835673")
+        legs = [len(trade['TP']) for trade, _, _ in rows]
+        width = max(legs)
+        takeProfits = np.array([trade['TP'] + [np.nan] * (width - count) for (trade, _, _), count in zip(rows, legs)], dtype=float)
 
-# Enables logging
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-logger = logging.getLogger(__name__)
+        balances, riskFactors, entries, stopLosses, pipSizes, pipValues, volumeSteps, maxVolumes, minVolumes = values.T
 
-# possible states for conversation handler
-CALCULATE, TRADE, DECISION = range(3)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sizes = SizePositions(balances, riskFactors, entries, stopLosses, takeProfits, pipSizes, pipValues, volumeSteps, maxVolumes)
 
-# allowed FX symbols
-SYMBOLS = ['AUDCAD', 'AUDCHF', 'AUDJPY', 'AUDNZD', 'AUDUSD', 'CADCHF', 'CADJPY', 'CHFJPY', 'EURAUD', 'EURCAD', 'EURCHF', 'EURGBP', 'EURJPY', 'EURNZD', 'EURUSD', 'GBPAUD', 'GBPCAD', 'GBPCHF', 'GBPJPY', 'GBPNZD', 'GBPUSD', 'NOW', 'NZDCAD', 'NZDCHF', 'NZDJPY', 'NZDUSD', 'USDCAD', 'USDCHF', 'USDJPY', 'XAGUSD', 'XAUUSD']
+        errors = [None] * len(rows)
+        stopAtEntry = sizes['StopLossPips'] == 0
 
-# RISK FACTOR
-RISK_FACTOR = float(os.environ.get("RISK_FACTOR"))
+        for index in np.flatnonzero(stopAtEntry).tolist():
+            errors[index] = 'Stop loss is at the entry price'
 
-# Helper Functions
-def ParseSignal(signal: str) -> dict:
-    """Starts process of parsing signal and entering trade on MetaTrader account.
+        # the broker rejects orders below the minimum volume, which includes legs rounded down to 0 lots
+        for index in np.flatnonzero(~stopAtEntry & ((sizes['LegVolume'] < minVolumes - 1e-9) | (sizes['LegVolume'] <= 0))).tolist():
+            errors[index] = f'Sizes to {sizes["LegVolume"][index]:g} lots per take profit, below the minimum volume of {rows[index][2]["MinVolume"]:g} lots'
+
+        columns = zip(rows, legs, errors, sizes['PositionSize'].tolist(), sizes['LegVolume'].tolist(), sizes['StopLossPips'].tolist(), sizes['TakeProfitPips'].tolist(),
+                      sizes['PotentialLoss'].tolist(), sizes['Profits'].tolist(), sizes['TotalProfit'].tolist())
+        sizings = []
+
+        for (trade, _, _), count, error, positionSize, legVolume, stopLossPips, takeProfitPips, potentialLoss, profits, totalProfit in columns:
+            if error is not None:
+                sizings.append({'Error': error})
+                continue
+
+            trade['PositionSize'] = positionSize
+            trade['LegVolume'] = legVolume
+            sizings.append({
+                'StopLossPips': int(stopLossPips),
+                'TakeProfitPips': [int(pips) for pips in takeProfitPips[:count]],
+                'PotentialLoss': potentialLoss,
+                'Profits': profits[:count],
+                'TotalProfit': totalProfit,
+                'Error': None,
+            })
+
+    return sizings
+
+def Reply(update: Update, text: str, **kwargs) -> None:
+    """Replies to the message of an update without blocking the event loop.
+
+    On the event loop the reply is queued on the outbound queue and sent by a reply thread, so the trade
+    carries on while Telegram accepts it; on other threads, or with an AsyncBot that queues by itself, it is
+    sent directly.
+    """
+
+    message = update.effective_message
+
+    if threading.current_thread() is eventLoopThread and not isinstance(message.bot, AsyncBot):
+        outbound.Put(message.chat_id, lambda: eventLoop.run_in_executor(replyExecutor, lambda: SendReply(message, text, kwargs)))
+        return
+
+    SendReply(message, text, kwargs)
+    return
+
+def SendReply(message, text: str, kwargs: dict) -> None:
+    """Sends a reply and records how long Telegram took to accept it."""
+
+    with latency.Measure('reply_send'):
+        message.reply_text(text, **kwargs)
+
+def ReplyTables(update: Update, tables: list) -> None:
+    """Replies with the trade tables, combining as many as fit into a single Telegram message."""
+
+    messages = ['']
+
+    for table in tables:
+        block = f'<pre>{table}</pre>'
+        if messages[-1] and len(messages[-1]) + len(block) + 1 > MAX_MESSAGE_LENGTH:
+            messages.append('')
+        messages[-1] = f'{messages[-1]}\n{block}' if messages[-1] else block
+
+    for message in messages:
+        Reply(update, message, parse_mode=ParseMode.HTML)
+
+    return
+
+def RenderTable(title: str, fieldNames: list, rows: list) -> str:
+    """Renders a titled, left aligned table in the same layout as a default PrettyTable.
+
+    Cells may span several lines. The column widths are found in a single pass over the cells and every
+    line is assembled directly with str.ljust.
 
     Arguments:
-        signal: trading signal
+        title: title centered above the table
+        fieldNames: header of every column
+        rows: cells of every row, converted with str
 
     Returns:
-        a dictionary that contains trade signal information
+        the rendered table
     """
 
-    signal = signal.splitlines()
-    signal = [line.rstrip() for line in signal]
-
-    trade = {}
-
-    if 'Buy Limit'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Buy Limit'
-    elif 'Sell Limit'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Sell Limit'
-    elif 'Buy Stop'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Buy Stop'
-    elif 'Sell Stop'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Sell Stop'
-    elif 'Buy'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Buy'
-    elif 'Sell'.lower() in signal[0].lower():
-        trade['OrderType'] = 'Sell'
-    else:
-        return {}
+    cells = [[str(value) for value in row] for row in rows]
+    widths = [len(name) for name in fieldNames]
 
-    trade['Symbol'] = (signal[0].split())[-1].upper()
+    for row in cells:
+        for index, value in enumerate(row):
+            width = max(map(len, value.split('\n'))) if '\n' in value else len(value)
+            if width > widths[index]:
+                widths[index] = width
 
-    if trade['Symbol'] not in SYMBOLS:
-        return {}
+    # columns grow in proportion when the title is wider than the table, as they do in PrettyTable
+    tableWidth = 2 + sum(width + 2 for width in widths)
 
-    if trade['OrderType'] == 'Buy' or trade['OrderType'] == 'Sell':
-        trade['Entry'] = (signal[1].split())[-1]
-    else:
-        trade['Entry'] = float((signal[1].split())[-1])
+    if tableWidth < len(title) + 4:
+        scale = (len(title) + 4) / tableWidth
+        widths = [math.ceil(width * scale) for width in widths]
 
-    trade['StopLoss'] = float((signal[2].split())[-1])
-    trade['TP'] = [float((signal[3].split())[-1])]
+    rule = '+' + '+'.join('-' * (width + 2) for width in widths) + '+'
+    inner = len(rule) - 2
+    lines = ['+' + '-' * inner + '+', '|' + f' {title} '.center(inner) + '|', rule]
+    lines.append('| ' + ' | '.join(name.ljust(width) for name, width in zip(fieldNames, widths)) + ' |')
+    lines.append(rule)
 
-    if len(signal) > 4:
-        trade['TP'].append(float(signal[4].split()[-1]))
+    for row in cells:
+        if not any('\n' in value for value in row):
+            lines.append('| ' + ' | '.join(value.ljust(width) for value, width in zip(row, widths)) + ' |')
+            continue
 
-    trade['RiskFactor'] = RISK_FACTOR
+        row = [value.split('\n') for value in row]
 
-    return trade
+        for y in range(max(len(cell) for cell in row)):
+            lines.append('| ' + ' | '.join((cell[y] if y < len(cell) else '').ljust(width) for cell, width in zip(row, widths)) + ' |')
 
-def GetTradeInformation(update: Update, trade: dict, balance: float) -> None:
-    if trade['Symbol'] == 'XAUUSD':
-        multiplier = 0.1
-    elif trade['Symbol'] == 'XAGUSD':
-        multiplier = 0.001
-    elif str(trade['Entry']).index('.') >= 2:
-        multiplier = 0.01
-    else:
-        multiplier = 0.0001
+    lines.append(rule)
+    return '\n'.join(lines)
+
+def FormatMoney(amount: float, currency: str = None) -> str:
+    """Formats an amount in the account currency, shown with $ while the currency is unknown."""
+
+    return '{} {:,.2f}'.format(currency or '$', amount)
+
+def CreateTable(trade: dict, balance: float, sizing: dict, currency: str = None) -> str:
+    rows = [
+        [trade["OrderType"], trade["Symbol"]],
+        ['Entry\n', trade['Entry']],
+        ['Stop Loss', '{} pips'.format(sizing['StopLossPips'])],
+    ]
+
+    for count, takeProfit in enumerate(sizing['TakeProfitPips']):
+        rows.append([f'TP {count + 1}', f'{takeProfit} pips'])
+
+    rows.append(['\nRisk Factor', '\n{:,.0f} %'.format(trade['RiskFactor'] * 100)])
+    rows.append(['Position Size', trade['PositionSize']])
+    rows.append(['\nCurrent Balance', '\n' + FormatMoney(balance, currency)])
+    rows.append(['Potential Loss', FormatMoney(sizing['PotentialLoss'], currency)])
+
+    for count, profit in enumerate(sizing['Profits']):
+        rows.append([f'TP {count + 1} Profit', FormatMoney(profit, currency)])
+
+    rows.append(['\nTotal Profit', '\n' + FormatMoney(sizing['TotalProfit'], currency)])
+
+    return RenderTable("Trade Information", ["Key", "Value"], rows)
 
-    stopLossPips = abs(round((trade['StopLoss'] - trade['Entry']) / multiplier))
-    trade['PositionSize'] = math.floor(((balance * trade['RiskFactor']) / stopLossPips) / 10 * 100) / 100
+async def PlaceOrder(connection, trade: dict, takeProfit: float) -> dict:
+    """Submits a single leg of a trade to MetaTrader.
 
-    takeProfitPips = []
-    for takeProfit in trade['TP']:
-        takeProfitPips.append(abs(round((takeProfit - trade['Entry']) / multiplier)))
+    Arguments:
+        connection: MetaApi RPC connection
+        trade: trade information
+        takeProfit: take profit of this leg
+
+    Returns:
+        the MetaApi trade response
+    """
+
+    method, pending = ORDER_METHODS[trade['OrderType']]
+    volume = trade['LegVolume']
+
+    try:
+        with latency.Measure('order'):
+            if pending:
+                result = await getattr(connection, method)(trade['Symbol'], volume, trade['Entry'], trade['StopLoss'], takeProfit)
+            else:
+                result = await getattr(connection, method)(trade['Symbol'], volume, trade['StopLoss'], takeProfit)
+    except Exception:
+        counters.Increment('orders_failed_total', symbol=trade['Symbol'], order_type=trade['OrderType'])
+        raise
+
+    counters.Increment('orders_placed_total', symbol=trade['Symbol'], order_type=trade['OrderType'])
+    return result
+
+async def ExecuteTrade(connection, trade: dict) -> list:
+    """Submits every take profit leg of a trade concurrently.
+
+    Arguments:
+        connection: MetaApi RPC connection
+        trade: trade information
+
+    Returns:
+        one MetaApi trade response or exception per take profit, in take profit order
+    """
+
+    return await asyncio.gather(*[PlaceOrder(connection, trade, takeProfit) for takeProfit in trade['TP']], return_exceptions=True)
+
+def ReportTrades(update: Update, trades: list, results: list) -> None:
+    lines = []
+    failed = False
 
-    table = CreateTable(trade, balance, stopLossPips, takeProfitPips)
-    update.effective_message.reply_text(f'<pre>{table}</pre>', parse_mode=ParseMode.HTML)
+    for trade, legs in zip(trades, results):
+        if len(trades) > 1:
+            lines.append(f'{trade["OrderType"]} {trade["Symbol"]}')
+
+        for count, result in enumerate(legs):
+            if isinstance(result, Exception):
+                logger.info(f'TP {count + 1} of {trade["Symbol"]} failed with error: {result}')
+                lines.append(f'TP {count + 1}: failed\n{result}')
+                failed = True
+            else:
+                logger.info(f'TP {count + 1} of {trade["Symbol"]} Result Code: {result["stringCode"]}')
+                lines.append(f'TP {count + 1}: {result["stringCode"]}')
+
+        if len(trades) > 1:
+            lines.append('')
+
+    if failed:
+        Reply(update, "There was an issue \n\nError Message:\n" + '\n'.join(lines))
+    else:
+        Reply(update, "Trade entered successfully, Good Luck!\n\n" + '\n'.join(lines))
+        logger.info('Trade entered successfully, Good Luck!')
 
     return
 
-def CreateTable(trade: dict, balance: float, stopLossPips: int, takeProfitPips: int) -> PrettyTable:
-    table = PrettyTable()
-    table.title = "Trade Information"
-    table.field_names = ["Key", "Value"]
-    table.align["Key"] = "l"  
-    table.align["Value"] = "l" 
+async def ResolveEntry(manager: ConnectionManager, trade: dict) -> None:
+    """Replaces the 'NOW' entry of a market execution trade with the current price on an account."""
 
-    table.add_row([trade["OrderType"], trade["Symbol"]])
-    table.add_row(['Entry\n', trade['Entry']])
-    table.add_row(['Stop Loss', '{} pips'.format(stopLossPips)])
+    price = await manager.GetPrice(trade['Symbol'])
 
-    for count, takeProfit in enumerate(takeProfitPips):
-        table.add_row([f'TP {count + 1}', f'{takeProfit} pips'])
+    if trade['OrderType'] == 'Buy':
+        trade['Entry'] = float(price['bid'])
+    elif trade['OrderType'] == 'Sell':
+        trade['Entry'] = float(price['ask'])
 
-    table.add_row(['\nRisk Factor', '\n{:,.0f} %'.format(trade['RiskFactor'] * 100)])
-    table.add_row(['Position Size', trade['PositionSize']])
-    table.add_row(['\nCurrent Balance', '\n$ {:,.2f}'.format(balance)])
-    table.add_row(['Potential Loss', '$ {:,.2f}'.format(round((trade['PositionSize'] * 10) * stopLossPips, 2))])
+async def FetchTradeData(stage: str, coroutine):
+    """Awaits one pre-trade request with the data timeout, recording its latency under the given stage."""
 
-    totalProfit = 0
-    for count, takeProfit in enumerate(takeProfitPips):
-        profit = round((trade['PositionSize'] * 10 * (1 / len(takeProfitPips))) * takeProfit, 2)
-        table.add_row([f'TP {count + 1} Profit', '$ {:,.2f}'.format(profit)])
-        totalProfit += profit
+    with latency.Measure(stage):
+        return await asyncio.wait_for(coroutine, DATA_TIMEOUT)
 
-    table.add_row(['\nTotal Profit', '\n$ {:,.2f}'.format(totalProfit)])
+def DescribeError(error: Exception) -> str:
+    return str(error) or type(error).__name__
 
-    return table
+async def GatherTradeData(manager: ConnectionManager, trades: list) -> dict:
+    """Fetches the account information, entry prices, symbol information and open positions of trades concurrently.
+
+    Only the account information is required. Trades whose price could not be fetched are left out, symbols whose
+    specification could not be fetched use their default sizing information, and a failure to fetch positions
+    skips the exposure check; each of these is listed in the returned errors.
+
+    Arguments:
+        manager: connection manager of the account
+        trades: trade information of every signal
+
+    Returns:
+        a dictionary with the account information, the trades that can be sized, the symbol information
+        of every symbol, the open positions (or None) and the errors of the failed requests
+    """
+
+    symbols = sorted({trade['Symbol'] for trade in trades})
+    market = [trade for trade in trades if trade['Entry'] == 'NOW']
+
+    results = await asyncio.gather(
+        FetchTradeData('account_info', manager.GetAccountInformation()),
+        FetchTradeData('positions', manager.GetPositions()),
+        *[FetchTradeData('symbol_info', manager.GetSymbolInfo(symbol)) for symbol in symbols],
+        *[FetchTradeData('price', ResolveEntry(manager, trade)) for trade in market],
+        return_exceptions=True,
+    )
+
+    if isinstance(results[0], Exception):
+        raise results[0]
+
+    data = {'Account': results[0], 'Positions': results[1], 'Symbols': {}, 'Trades': [], 'Errors': []}
+
+    if isinstance(data['Positions'], Exception):
+        data['Errors'].append(f'Open positions: {DescribeError(data["Positions"])}')
+        data['Positions'] = None
+
+    for symbol, symbolInfo in zip(symbols, results[2:2 + len(symbols)]):
+        if isinstance(symbolInfo, Exception):
+            data['Errors'].append(f'{symbol} specification: {DescribeError(symbolInfo)}')
+            symbolInfo = manager.symbols[symbol]
+        data['Symbols'][symbol] = symbolInfo
+
+    unpriced = []
+    for trade, result in zip(market, results[2 + len(symbols):]):
+        if isinstance(result, Exception):
+            data['Errors'].append(f'{trade["Symbol"]} price: {DescribeError(result)}')
+            unpriced.append(trade)
+
+    data['Trades'] = [trade for trade in trades if not any(trade is failed for failed in unpriced)]
+
+    for error in data['Errors']:
+        logger.warning(f'{manager.name}: Could not fetch trade data: {error}')
+
+    return data
+
+def DescribeExposure(trades: list, positions: list) -> str:
+    """Describes the open positions on the symbols of the trades, or returns an empty string if there are none."""
+
+    lines = []
+
+    for symbol in sorted({trade['Symbol'] for trade in trades}):
+        open_positions = [position for position in positions if position.get('symbol') == symbol]
+        if open_positions:
+            volume = sum(position.get('volume', 0) for position in open_positions)
+            lines.append(f'{symbol}: {len(open_positions)} open position(s), {volume:,.2f} lots')
+
+    return '\n'.join(lines)
+
+def CopySignals(signals: list, riskFactor: float) -> list:
+    """Returns copies of the parsed signals for one account, so pricing and sizing never change the signals themselves."""
+
+    return [dict(signal, TP=list(signal['TP']), RiskFactor=riskFactor) for signal in signals]
+
+async def PrepareAccount(manager: ConnectionManager, signals: list, update: Update = None) -> dict:
+    """Connects to an account and prices its copy of the signals.
+
+    Progress and errors are replied to the update when one is given, which is the case when a single account
+    is configured; otherwise they are only returned for the consolidated report.
+
+    Arguments:
+        manager: connection manager of the account
+        signals: parsed trade information of every signal
+        update: Telegram update to reply to, or None
+
+    Returns:
+        a dictionary with the account manager, balance and its currency, priced trades, trades rejected by the
+        sizing, symbol information, open positions, data errors and the error that stopped the account from
+        trading, if any
+    """
+
+    account = {'Manager': manager, 'Balance': None, 'Currency': None, 'Trades': [], 'Rejected': [], 'Symbols': {}, 'Positions': None, 'Errors': [], 'Error': None, 'Results': None}
 
-async def ConnectMetaTrader(update: Update, trade: dict, enterTrade: bool):
-    api = MetaApi(API_KEY)
-    
     try:
-        account = await api.metatrader_account_api.get_account(ACCOUNT_ID)
-        initial_state = account.state
-        deployed_states = ['DEPLOYING', 'DEPLOYED']
+        with latency.Measure('connection'):
+            await manager.GetConnection()
 
-        if initial_state not in deployed_states:
-            logger.info('Deploying account')
-            await account.deploy()
+        with latency.Measure('trade_data'):
+            data = await GatherTradeData(manager, CopySignals(signals, manager.riskFactor))
 
-        logger.info('Waiting for API server to connect to broker ...')
-        await account.wait_connected()
+        account_information = data['Account']
 
-        connection = account.get_rpc_connection()
-        await connection.connect()
+        if account_information['login'] != manager.allowedLogin:
+            logger.error(f'{manager.name}: Connected to an unauthorized MT4 account.')
+            account['Error'] = 'Unauthorized MT4 account'
+            if update:
+                Reply(update, "Connected to an unauthorized MT4 account. Operation aborted.")
+            return account
 
-        logger.info('Waiting for SDK to synchronize to terminal state ...')
-        await connection.wait_synchronized()
+        account['Balance'] = account_information['balance']
+        # pip values are converted to the account currency, so balances, losses and profits are all shown in it
+        account['Currency'] = account_information.get('currency')
+        account['Errors'] = data['Errors']
 
-        account_information = await connection.get_account_information()
+        if update:
+            Reply(update, "Successfully connected to MetaTrader!\nCalculating trade risk ...")
+            if data['Errors']:
+                Reply(update, "Some trade data could not be loaded:\n\n" + '\n'.join(data['Errors']))
 
-        if account_information['login'] != int(ALLOWED_MT4_ACCOUNT_NUMBER):
-            update.effective_message.reply_text("Connected to an unauthorized MT4 account. Operation aborted.")
-            logger.error('Connected to an unauthorized MT4 account.')
-            return
+        account['Trades'] = data['Trades']
+        account['Symbols'] = data['Symbols']
+        account['Positions'] = data['Positions']
 
-        update.effective_message.reply_text("Successfully connected to MetaTrader!\nCalculating trade risk ...")
+    except Exception as error:
+        logger.error(f'{manager.name}: Error: {error}')
+        account['Error'] = DescribeError(error)
+        if update:
+            Reply(update, f"There was an issue with the connection \n\nError Message:\n{error}")
+        await manager.ReportFailure(error)
 
-        if trade['Entry'] == 'NOW':
-            price = await connection.get_symbol_price(symbol=trade['Symbol'])
+    return account
 
-            if trade['OrderType'] == 'Buy':
-                trade['Entry'] = float(price['bid'])
-            elif trade['OrderType'] == 'Sell':
-                trade['Entry'] = float(price['ask'])
+def SizeAccounts(accounts: list, update: Update = None) -> None:
+    """Sizes the trades of every account in one vectorized call.
+
+    Trades that cannot be sized are moved to the rejected trades of their account and listed in its errors, like
+    trades that could not be priced. The trade tables and open positions are replied to the update when one is given.
+    """
+
+    sized = [account for account in accounts if account['Error'] is None]
+    rows = [(trade, account['Balance'], account['Symbols'][trade['Symbol']]) for account in sized for trade in account['Trades']]
+    sizings = iter(SizeTrades(rows))
+    tables = []
+    rejected = []
+
+    for account in sized:
+        trades = []
+
+        for trade in account['Trades']:
+            sizing = next(sizings)
+
+            if sizing['Error'] is not None:
+                logger.warning(f'{account["Manager"].name}: Could not size {trade["OrderType"]} {trade["Symbol"]}: {sizing["Error"]}')
+                account['Errors'].append(f'{trade["OrderType"]} {trade["Symbol"]}: {sizing["Error"]}')
+                account['Rejected'].append(trade)
+                rejected.append(account['Errors'][-1])
+                continue
+
+            trades.append(trade)
+            if update:
+                tables.append((trade, account['Balance'], sizing, account['Currency']))
+
+        account['Trades'] = trades
+
+    if not update:
+        return
+
+    if rejected:
+        Reply(update, "Some trades could not be sized and will not be entered:\n\n" + '\n'.join(rejected))
+
+    if not tables:
+        return
+
+    with latency.Measure('table_render'):
+        tables = [CreateTable(*table) for table in tables]
+
+    ReplyTables(update, tables)
+
+    for account in accounts:
+        exposure = DescribeExposure(account['Trades'], account['Positions'] or [])
+
+        if exposure:
+            Reply(update, f"Note: you already have open positions on these symbols\n\n{exposure}")
+
+    return
+
+async def EnterAccount(account: dict, update: Update = None) -> None:
+    """Places the sized trades of an account and stores the result of every leg in the account.
+
+    Arguments:
+        account: account returned by PrepareAccount
+        update: Telegram update to report the orders to, or None when the report is consolidated
+    """
+
+    manager = account['Manager']
+
+    try:
+        async with manager.Trading() as connection:
+            if update:
+                Reply(update, "Entering trade on MetaTrader Account ...")
+
+            with latency.Measure('orders'):
+                account['Results'] = await asyncio.gather(*[ExecuteTrade(connection, trade) for trade in account['Trades']])
+
+        if update:
+            ReportTrades(update, account['Trades'], account['Results'])
 
-        GetTradeInformation(update, trade, account_information['balance'])
-            
-        if enterTrade:
-            update.effective_message.reply_text("Entering trade on MetaTrader Account ...")
-            try:
-                if trade['OrderType'] == 'Buy':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_market_buy_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['StopLoss'], takeProfit)
-                elif trade['OrderType'] == 'Buy Limit':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_limit_buy_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['Entry'], trade['StopLoss'], takeProfit)
-                elif trade['OrderType'] == 'Buy Stop':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_stop_buy_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['Entry'], trade['StopLoss'], takeProfit)
-                elif trade['OrderType'] == 'Sell':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_market_sell_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['StopLoss'], takeProfit)
-                elif trade['OrderType'] == 'Sell Limit':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_limit_sell_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['Entry'], trade['StopLoss'], takeProfit)
-                elif trade['OrderType'] == 'Sell Stop':
-                    for takeProfit in trade['TP']:
-                        result = await connection.create_stop_sell_order(trade['Symbol'], trade['PositionSize'] / len(trade['TP']), trade['Entry'], trade['StopLoss'], takeProfit)
-                
-                update.effective_message.reply_text("Trade entered successfully, Good Luck!")
-                logger.info('\nTrade entered successfully, Good Luck!')
-                logger.info('Result Code: {}\n'.format(result['stringCode']))
-            
-            except Exception as error:
-                logger.info(f"\nTrade failed with error: {error}\n")
-                update.effective_message.reply_text(f"There was an issue \n\nError Message:\n{error}")
-    
     except Exception as error:
-        logger.error(f'Error: {error}')
-        update.effective_message.reply_text(f"There was an issue with the connection \n\nError Message:\n{error}")
-    
+        logger.error(f'{manager.name}: Error: {error}')
+        account['Error'] = DescribeError(error)
+        if update:
+            Reply(update, f"There was an issue with the connection \n\nError Message:\n{error}")
+        await manager.ReportFailure(error)
+
+    return
+
+def ReplyAccounts(update: Update, accounts: list) -> None:
+    """Replies with one table summarizing the balance, lot size and order results of every account."""
+
+    rows = []
+    notes = []
+
+    for account in accounts:
+        name = account['Manager'].name
+        balance = '-' if account['Balance'] is None else FormatMoney(account['Balance'], account['Currency'])
+
+        rejected = [[name, balance, f'{trade["OrderType"]} {trade["Symbol"]}', '-', 'Not sized'] for trade in account['Rejected']]
+
+        if not account['Trades']:
+            rows.extend(rejected or [[name, balance, '-', '-', account['Error'] or 'No trade to enter']])
+            notes.extend(f'{name}: {error}' for error in account['Errors'])
+            continue
+
+        if account['Error'] is not None:
+            notes.append(f'{name}: {account["Error"]}')
+
+        for trade, legs in zip(account['Trades'], account['Results'] or [[]] * len(account['Trades'])):
+            lines = []
+            for count, result in enumerate(legs):
+                if isinstance(result, Exception):
+                    logger.info(f'{name}: TP {count + 1} of {trade["Symbol"]} failed with error: {result}')
+                    lines.append(f'TP {count + 1}: failed')
+                    notes.append(f'{name} {trade["Symbol"]} TP {count + 1}: {DescribeError(result)}')
+                else:
+                    lines.append(f'TP {count + 1}: {result["stringCode"]}')
+            rows.append([name, balance, f'{trade["OrderType"]} {trade["Symbol"]}', trade['PositionSize'], '\n'.join(lines)])
+
+        rows.extend(rejected)
+        notes.extend(f'{name}: {error}' for error in account['Errors'])
+
+    ReplyTables(update, [RenderTable("Accounts", ["Account", "Balance", "Trade", "Lots", "Result"], rows)])
+
+    if notes:
+        Reply(update, "Some accounts reported issues:\n\n" + '\n'.join(notes))
+
+    return
+
+async def ForEachAccount(coroutine, accounts: list) -> list:
+    """Runs a coroutine for every account concurrently, at most MAX_PARALLEL_ACCOUNTS at a time."""
+
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_ACCOUNTS)
+
+    async def Run(account):
+        async with semaphore:
+            return await coroutine(account)
+
+    return await asyncio.gather(*[Run(account) for account in accounts])
+
+async def ConnectMetaTrader(update: Update, trades: list, enterTrade: bool):
+    """Prices, sizes and optionally enters trades on every MetaTrader account.
+
+    Each account prices its own copy of the signals, after which the trades of all accounts are sized together
+    with each account's balance and risk factor. A single account reports every step as before, several
+    accounts are reported in one consolidated table.
+
+    Arguments:
+        update: Telegram update of the message that requested the trades
+        trades: trade information of every signal
+        enterTrade: whether to place the orders or only calculate them
+
+    Returns:
+        a snapshot of the calculation that can be entered later, or None if it failed
+    """
+
+    start = time.perf_counter()
+    single = len(connectionManagers) == 1
+    report = update if single else None
+
+    try:
+        accounts = await ForEachAccount(lambda manager: PrepareAccount(manager, trades, report), connectionManagers)
+        SizeAccounts(accounts, report)
+
+        if enterTrade:
+            await ForEachAccount(lambda account: EnterAccount(account, report), [account for account in accounts if account['Error'] is None and account['Trades']])
+    finally:
+        latency.Record('trade' if enterTrade else 'calculate', time.perf_counter() - start)
+        logger.info(f'{"Trade" if enterTrade else "Calculation"} of {len(trades)} signal(s) on {len(connectionManagers)} account(s) took {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    if not single:
+        ReplyAccounts(update, accounts)
+
+    ready = [account for account in accounts if account['Error'] is None and account['Trades']]
+
+    if not ready:
+        return None
+
+    return {'Signals': trades, 'Accounts': ready, 'Timestamp': time.monotonic()}
+
+async def EnterSnapshot(update: Update, snapshot: dict) -> None:
+    """Enters trades that were already priced and sized by /calculate.
+
+    The orders are submitted straight from the snapshot. A snapshot older than SNAPSHOT_TOLERANCE seconds is
+    recalculated first, with market execution trades priced again.
+
+    Arguments:
+        update: Telegram update of the /yes command
+        snapshot: snapshot returned by ConnectMetaTrader for the calculation
+    """
+
+    if time.monotonic() - snapshot['Timestamp'] > SNAPSHOT_TOLERANCE:
+        logger.info('Calculation is out of date, pricing trades again')
+        await ConnectMetaTrader(update, snapshot['Signals'], True)
+        return
+
+    start = time.perf_counter()
+    single = len(connectionManagers) == 1
+    accounts = snapshot['Accounts']
+
+    try:
+        await ForEachAccount(lambda account: EnterAccount(account, update if single else None), accounts)
+    finally:
+        latency.Record('trade', time.perf_counter() - start)
+        logger.info(f'Trade of {len(snapshot["Signals"])} calculated signal(s) on {len(accounts)} account(s) took {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    if not single:
+        ReplyAccounts(update, accounts)
+
     return
 
 def PlaceTrade(update: Update, context: CallbackContext) -> int:
-    if context.user_data['trade'] is None:
+    if context.user_data['trades'] is None:
         try: 
-            trade = ParseSignal(update.effective_message.text)
-            if not trade:
-                raise Exception('Invalid Trade')
-            context.user_data['trade'] = trade
-            update.effective_message.reply_text("Trade Successfully Parsed! \nConnecting to MetaTrader ... \n(May take a while)")
+            RecordReceived(update)
+            with latency.Measure('parse'):
+                trades = ParseSignals(update.effective_message.text)
+            counters.Increment('signals_parsed_total', len(trades))
+            context.user_data['trades'] = trades
+            Reply(update, f"{ParsedMessage(trades)} \nConnecting to MetaTrader ... \n(May take a while)")
         except Exception as error:
             logger.error(f'Error: {error}')
+            counters.Increment('signals_rejected_total')
             errorMessage = f"There was an error parsing this trade \n\nError: {error}\n\nPlease re-enter trade with this format:\n\nBUY/SELL SYMBOL\nEntry \nSL \nTP \n\nOr use the /cancel to command to cancel this action."
             update.effective_message.reply_text(errorMessage)
             return TRADE
-    
-    asyncio.run(ConnectMetaTrader(update, context.user_data['trade'], True))
-    context.user_data['trade'] = None
+
+    calculation = context.user_data.get('calculation')
+
+    # a /yes sent before the calculation finished would otherwise calculate and enter the trade a second time
+    if calculation is not None and not calculation.done():
+        Reply(update, "The trade is still being calculated. Please wait for the result before entering it.")
+        return DECISION
+
+    snapshot = context.user_data.get('snapshot')
+
+    if snapshot is not None and snapshot['Signals'] is context.user_data['trades']:
+        SubmitCoroutine(EnterSnapshot(update, snapshot))
+    else:
+        SubmitCoroutine(ConnectMetaTrader(update, context.user_data['trades'], True))
+
+    context.user_data['trades'] = None
+    context.user_data['snapshot'] = None
+    context.user_data['calculation'] = None
     return ConversationHandler.END
 
 def CalculateTrade(update: Update, context: CallbackContext) -> int:
-    if context.user_data['trade'] is None:
+    if context.user_data['trades'] is None:
         try: 
-            trade = ParseSignal(update.effective_message.text)
-            if not trade:
-                raise Exception('Invalid Trade')
-            context.user_data['trade'] = trade
-            update.effective_message.reply_text("Trade Successfully Parsed!\nConnecting to MetaTrader ... (May take a while)")
+            RecordReceived(update)
+            with latency.Measure('parse'):
+                trades = ParseSignals(update.effective_message.text)
+            counters.Increment('signals_parsed_total', len(trades))
+            context.user_data['trades'] = trades
+            Reply(update, f"{ParsedMessage(trades)}\nConnecting to MetaTrader ... (May take a while)")
         except Exception as error:
             logger.error(f'Error: {error}')
+            counters.Increment('signals_rejected_total')
             errorMessage = f"There was an error parsing this trade 😕\n\nError: {error}\n\nPlease re-enter trade with this format:\n\nBUY/SELL SYMBOL\nEntry \nSL \nTP \n\nOr use the /cancel to command to cancel this action."
             update.effective_message.reply_text(errorMessage)
             return CALCULATE
     
-    asyncio.run(ConnectMetaTrader(update, context.user_data['trade'], False))
-    update.effective_message.reply_text("Would you like to enter this trade?\nTo enter, select: /yes\nTo decline, select: /no")
+    calculation = context.user_data['calculation'] = SubmitCoroutine(ConnectMetaTrader(update, context.user_data['trades'], False))
+    calculation.add_done_callback(lambda future: AskDecision(update, context, future))
     return DECISION
 
+def AskDecision(update: Update, context: CallbackContext, calculation: concurrent.futures.Future) -> None:
+    # the conversation moved on, with /no, /cancel or a new command, while the trade was being calculated
+    if context.user_data.get('calculation') is not calculation:
+        return
+    if not calculation.cancelled() and calculation.exception() is None:
+        context.user_data['snapshot'] = calculation.result()
+    Reply(update, "Would you like to enter this trade?\nTo enter, select: /yes\nTo decline, select: /no")
+    return
+
+def NotifyIfNotReady(update: Update) -> None:
+    if not all(manager.ready.is_set() for manager in connectionManagers):
+        Reply(update, "The bot is still connecting to your MetaTrader account. Your trade will be processed as soon as the account is synchronized.")
+    return
+
+def RecordReceived(update: Update) -> None:
+    """Records the delay between Telegram receiving a message and the bot handling it."""
+
+    if update.effective_message.date is not None:
+        latency.Record('telegram_receive', max(0.0, time.time() - update.effective_message.date.timestamp()))
+
+def ParsedMessage(trades: list) -> str:
+    if len(trades) == 1:
+        return "Trade Successfully Parsed!"
+    return f"{len(trades)} Trades Successfully Parsed!"
+
 def unknown_command(update: Update, context: CallbackContext) -> None:
     if not (update.effective_message.chat.username == TELEGRAM_USER):
         update.effective_message.reply_text("Sorry, You are not authorized to use this bot!")
@@ -271,12 +1901,12 @@ def welcome(update: Update, context: CallbackContext) -> None:
     return
 
 def help(update: Update, context: CallbackContext) -> None:
-    help_message = "This bot is used to automatically enter trades onto your MetaTrader account directly from Telegram. To begin, ensure that you are authorized to use this bot by adjusting your Python script or environment variables.\n\nThis bot supports all trade order types (Market Execution, Limit, and Stop)\n\nAfter an extended period away from the bot, please be sure to re-enter the start command to restart the connection to your MetaTrader account."
-    commands = "List of commands:\n/start : displays welcome message\n/help : displays list of commands and example trades\n/trade : takes in user inputted trade for parsing and placement\n/calculate : calculates trade information for a user inputted trade"
+    help_message = "This bot is used to automatically enter trades onto your MetaTrader account directly from Telegram. To begin, ensure that you are authorized to use this bot by adjusting your Python script or environment variables.\n\nThis bot supports all trade order types (Market Execution, Limit, and Stop)\n\nThe connection to your MetaTrader account is kept alive and re-established automatically."
+    commands = "List of commands:\n/start : displays welcome message\n/help : displays list of commands and example trades\n/trade : takes in user inputted trade for parsing and placement\n/calculate : calculates trade information for a user inputted trade\n/latency : displays recent latency of each trading stage"
     trade_example = "Example Trades:\n\n"
     market_execution_example = "Market Execution:\nBUY GBPUSD\nEntry NOW\nSL 1.14336\nTP 1.28930\nTP 1.29845\n\n"
     limit_example = "Limit Execution:\nBUY LIMIT GBPUSD\nEntry 1.14480\nSL 1.14336\nTP 1.28930\n\n"
-    note = "You are able to enter up to two take profits. If two are entered, both trades will use half of the position size, and one will use TP1 while the other uses TP2.\n\nNote: Use 'NOW' as the entry to enter a market execution trade."
+    note = "You are able to enter up to two take profits. If two are entered, both trades will use half of the position size, and one will use TP1 while the other uses TP2.\n\nYou can also send several trades in one message by separating them with an empty line.\n\nNote: Use 'NOW' as the entry to enter a market execution trade."
     update.effective_message.reply_text(help_message)
     update.effective_message.reply_text(commands)
     update.effective_message.reply_text(trade_example + market_execution_example + limit_example + note)
@@ -284,18 +1914,65 @@ def help(update: Update, context: CallbackContext) -> None:
 
 def cancel(update: Update, context: CallbackContext) -> int:
     update.effective_message.reply_text("Command has been canceled.")
-    context.user_data['trade'] = None
+    context.user_data['trades'] = None
+    context.user_data['snapshot'] = None
+    context.user_data['calculation'] = None
     return ConversationHandler.END
 
+def record_update(update: Update, context: CallbackContext) -> None:
+    try:
+        recorder.Record(update)
+    except Exception as error:
+        logger.warning(f'Could not record update {update.update_id}: {error}')
+    return
+
+def drop_duplicate(update: Update, context: CallbackContext) -> None:
+    if deduplicator.IsDuplicate(update.update_id):
+        logger.warning(f'Dropping redelivered update {update.update_id}')
+        counters.Increment('updates_duplicate_total')
+        raise DispatcherHandlerStop()
+    return
+
 def error(update: Update, context: CallbackContext) -> None:
     logger.warning('Update "%s" caused error "%s"', update, context.error)
     return
 
+def latency_command(update: Update, context: CallbackContext) -> None:
+    if not (update.effective_message.chat.username == TELEGRAM_USER):
+        update.effective_message.reply_text("Sorry, You are not authorized to use this bot!")
+        return
+    update.effective_message.reply_text(f'<pre>Latency (ms)\n\n{latency.Summary()}</pre>', parse_mode=ParseMode.HTML)
+    return
+
+async def WarmUp() -> None:
+    """Synchronizes the connections and refreshes the balances while the user is typing a signal."""
+
+    async def WarmUpAccount(manager):
+        await manager.GetConnection()
+        # refreshed at half the TTL so the balance is still cached when the signal arrives
+        await manager.GetAccountInformation(ACCOUNT_INFO_TTL / 2)
+
+    with latency.Measure('warm_up'):
+        await ForEachAccount(WarmUpAccount, connectionManagers)
+
+def StartWarmUp() -> None:
+    global warmUp
+
+    if warmUp is None or warmUp.done():
+        warmUp = SubmitCoroutine(WarmUp())
+    return
+
+warmUp = None
+
 def Trade_Command(update: Update, context: CallbackContext) -> int:
     if not (update.effective_message.chat.username == TELEGRAM_USER):
         update.effective_message.reply_text("You are not authorized to use this bot!")
         return ConversationHandler.END
-    context.user_data['trade'] = None
+    context.user_data['trades'] = None
+    context.user_data['snapshot'] = None
+    context.user_data['calculation'] = None
+    StartWarmUp()
+    NotifyIfNotReady(update)
     update.effective_message.reply_text("Please enter the trade that you would like to place.")
     return TRADE
 
@@ -303,16 +1980,29 @@ def Calculation_Command(update: Update, context: CallbackContext) -> int:
     if not (update.effective_message.chat.username == TELEGRAM_USER):
         update.effective_message.reply_text("Sorry, You are not authorized to use this bot!")
         return ConversationHandler.END
-    context.user_data['trade'] = None
+    context.user_data['trades'] = None
+    context.user_data['snapshot'] = None
+    context.user_data['calculation'] = None
+    StartWarmUp()
+    NotifyIfNotReady(update)
     update.effective_message.reply_text("Please enter the trade that you would like to calculate.")
     return CALCULATE
 
-def main() -> None:
-    updater = Updater(TOKEN, use_context=True)
-    dp = updater.dispatcher
+def RegisterHandlers(dp: Dispatcher) -> None:
+    """Registers the command, conversation and error handlers of the bot on a dispatcher."""
+
+    # the webhook acknowledges each update as soon as it is queued for the dispatcher, or handled on the event loop
+    # with ASYNC_DISPATCHER, and trades run on the background event loop, so handlers return immediately;
+    # redelivered updates are dropped before any handler
+    dp.add_handler(TypeHandler(Update, drop_duplicate), group=-1)
+
+    # redelivered updates are recorded as well, so a replay reproduces them
+    if recorder is not None:
+        dp.add_handler(TypeHandler(Update, record_update), group=-2)
 
     dp.add_handler(CommandHandler("start", welcome))
     dp.add_handler(CommandHandler("help", help))
+    dp.add_handler(CommandHandler("latency", latency_command))
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("trade", Trade_Command), CommandHandler("calculate", Calculation_Command)],
@@ -327,7 +2017,65 @@ def main() -> None:
     dp.add_handler(conv_handler)
     dp.add_handler(MessageHandler(Filters.text, unknown_command))
     dp.add_error_handler(error)
-    
+    return
+
+def CreateAsyncDispatcher(bot: AsyncBot) -> Dispatcher:
+    """Creates a dispatcher with the handlers of the bot that processes updates on the calling thread.
+
+    The dispatcher has no worker threads and is never started; the webhook calls process_update on the event
+    loop, where the handlers schedule the trades as tasks and queue their replies without blocking.
+    """
+
+    # the worker thread only runs handlers registered with run_async and is never started
+    dispatcher = Dispatcher(bot, queue.Queue(), workers=1, use_context=True)
+    RegisterHandlers(dispatcher)
+    return dispatcher
+
+async def ServeWebhook(dispatcher: Dispatcher) -> web.AppRunner:
+    """Serves the Telegram webhook with aiohttp on the event loop and hands every update to the dispatcher."""
+
+    async def HandleUpdate(request: web.Request) -> web.Response:
+        try:
+            dispatcher.process_update(Update.de_json(await request.json(), dispatcher.bot))
+        except Exception as error:
+            # Telegram redelivers updates that are not acknowledged, which would fail the same way
+            logger.error(f'Could not handle update: {error}')
+        return web.Response()
+
+    application = web.Application()
+    application.router.add_post(f'/{TOKEN}', HandleUpdate)
+    runner = web.AppRunner(application, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', PORT).start()
+    logger.info(f'Serving the webhook on port {PORT}')
+    return runner
+
+def main() -> None:
+    if ASYNC_DISPATCHER:
+        bot = AsyncBot(TOKEN)
+        # fetched up front so handlers never request it from the event loop
+        bot.get_me()
+        dispatcher = CreateAsyncDispatcher(bot)
+    else:
+        updater = Updater(TOKEN, use_context=True)
+        RegisterHandlers(updater.dispatcher)
+
+    if METRICS_PORT:
+        StartMetricsServer(int(METRICS_PORT))
+
+    SubmitCoroutine(MonitorEventLoop())
+
+    # the account is deployed and synchronized in the background so the webhook binds its port straight away,
+    # and handlers tell the user when a signal has to wait for the connection
+    for manager in connectionManagers:
+        SubmitCoroutine(Startup(manager))
+
+    if ASYNC_DISPATCHER:
+        SubmitCoroutine(ServeWebhook(dispatcher)).result()
+        bot.set_webhook(APP_URL + TOKEN)
+        eventLoopThread.join()
+        return
+
     updater.start_webhook(listen="0.0.0.0", port=PORT, url_path=TOKEN, webhook_url=APP_URL + TOKEN)
     updater.idle()
     return